@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+
+import time
+
+import explorerhat
+
+
+ROUNDS = 100
+
+print("""
+Compares round-robin throughput of all four analog inputs using
+explorerhat.analog.read(), which reads each channel in turn, against
+explorerhat.analog.scan(), which runs the conversions back to back.
+
+Runs {rounds} rounds of each, this will take a few seconds.
+""".format(rounds=ROUNDS))
+
+if not explorerhat.setup_analog():
+    raise RuntimeError("Analog is unavailable, check your pHAT/HAT and/or connections!")
+
+
+def benchmark(name, function):
+    t_start = time.time()
+    for x in range(ROUNDS):
+        function()
+    t_elapsed = time.time() - t_start
+    print("{:<16} {:8.1f} rounds/sec {:8.1f} samples/sec".format(
+        name, ROUNDS / t_elapsed, ROUNDS * len(explorerhat.analog) / t_elapsed))
+    return t_elapsed
+
+
+t_read = benchmark("analog.read()", explorerhat.analog.read)
+t_scan = benchmark("analog.scan()", explorerhat.analog.scan)
+
+print("\nscan() is {:.1f}x the speed of read()".format(t_read / t_scan))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+import os
+import time
+
+import explorerhat
+from explorerhat.pins import AsyncWorker
+
+
+DURATION = 5
+RATE = 100
+
+print("""
+Compares watching all four analog inputs with one thread per input,
+as explorerhat used to, against the shared analog scheduler.
+
+Each input is read {rate} times a second, for {duration} seconds per test.
+""".format(rate=RATE, duration=DURATION))
+
+if not explorerhat.setup_analog():
+    raise RuntimeError("Analog is unavailable, check your pHAT/HAT and/or connections!")
+
+
+def measure(name, start, stop):
+    samples = [0]
+
+    def count(*args):
+        samples[0] += 1
+
+    cpu_start = sum(os.times()[:2])
+    t_start = time.time()
+    start(count)
+    time.sleep(DURATION)
+    stop()
+    t_elapsed = time.time() - t_start
+    cpu_elapsed = sum(os.times()[:2]) - cpu_start
+
+    print("{:<12} {:8.1f} samples/sec {:6.1f}% CPU".format(
+        name, samples[0] / t_elapsed, 100.0 * cpu_elapsed / t_elapsed))
+
+
+workers = []
+
+
+def start_threads(count):
+    for analog_input in explorerhat.analog:
+        def watch(analog_input=analog_input):
+            analog_input.read()
+            count()
+            time.sleep(1.0 / RATE)
+        workers.append(AsyncWorker(watch))
+    for worker in workers:
+        worker.start()
+
+
+def stop_threads():
+    for worker in workers:
+        worker.stop()
+
+
+def start_scheduler(count):
+    # A negative sensitivity fires the handler on every reading
+    for analog_input in explorerhat.analog:
+        analog_input.changed(count, -1, rate=RATE)
+
+
+def stop_scheduler():
+    explorerhat.analog.clear_events()
+
+
+measure("per-thread", start_threads, stop_threads)
+measure("scheduler", start_scheduler, stop_scheduler)
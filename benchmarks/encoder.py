@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+import sys
+import time
+
+import RPi.GPIO as GPIO
+
+import explorerhat
+
+
+EDGES = 100000
+LOOPBACK_EDGES = 2000
+RATES = [100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000]
+
+print("""
+Finds the fastest step rate the quadrature decoder keeps up with.
+
+First {edges} edges are fed straight into the decoder, for the most it
+could ever manage. Then, with --loopback, outputs one and two drive a
+real quadrature signal into inputs one and two at rising rates until
+steps go missing.
+
+For --loopback wire output one to input one and output two to input
+two, each input with a pull-up resistor to 5v.
+
+Usage: {name} [--loopback]
+""".format(edges=EDGES, name=sys.argv[0]))
+
+explorerhat.setup_gpio()
+
+# Gray code, B changes on even edges and A on odd ones
+SEQUENCE = [(0, 1), (1, 1), (1, 0), (0, 0)]
+
+encoder = explorerhat.Encoder(explorerhat.input.one, explorerhat.input.two)
+mode = "line events" if encoder._line_events is not None else "RPi.GPIO callbacks"
+encoder.stop()
+
+# Straight into the decoder, no GPIO involved
+encoder.state = 0
+encoder.reset()
+
+t_start = time.time()
+for edge in range(EDGES):
+    a, b = SEQUENCE[edge % 4]
+    if edge % 2:
+        encoder._edge_a(0, a)
+    else:
+        encoder._edge_b(0, b)
+t_elapsed = time.time() - t_start
+
+print("Decoder alone: {:.0f} edges/sec, position {} errors {}".format(EDGES / t_elapsed, encoder.position, encoder.errors))
+
+if '--loopback' not in sys.argv:
+    sys.exit(0)
+
+pin_a = explorerhat.OUT1
+pin_b = explorerhat.OUT2
+GPIO.setup(pin_a, GPIO.OUT, initial=GPIO.LOW)
+GPIO.setup(pin_b, GPIO.OUT, initial=GPIO.LOW)
+
+print("\nLoopback through {}:".format(mode))
+
+for rate in RATES:
+    encoder = explorerhat.Encoder(explorerhat.input.one, explorerhat.input.two)
+    period = 1.0 / rate
+
+    t_start = time.time()
+    deadline = t_start
+    for edge in range(LOOPBACK_EDGES):
+        deadline += period
+        while time.time() < deadline:
+            pass
+        a, b = SEQUENCE[edge % 4]
+        if edge % 2:
+            GPIO.output(pin_a, a)
+        else:
+            GPIO.output(pin_b, b)
+    actual = LOOPBACK_EDGES / (time.time() - t_start)
+
+    # Give the decoder a moment to catch up
+    time.sleep(0.2)
+    encoder.stop()
+
+    # The outputs sink current, so the inputs see both signals inverted, which counts the same way
+    ok = abs(encoder.position) == LOOPBACK_EDGES and encoder.errors == 0
+    print("{:6d} edges/sec ( {:.0f} actual ) position {:6d} errors {:4d} {}".format(
+        rate, actual, encoder.position, encoder.errors, "ok" if ok else "FAILED"))
+
+    if not ok:
+        break
+
+GPIO.output(pin_a, 0)
+GPIO.output(pin_b, 0)
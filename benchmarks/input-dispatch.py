@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+import time
+
+import explorerhat
+
+
+EDGES = 10000
+
+print("""
+Times the path from an input edge to its handlers, {edges} times over.
+
+Compares the old handler, which read the input once to pick pressed or
+released and again for changed, against sampling the level just once.
+
+Edges are fed straight into the handlers, so nothing needs wiring up.
+""".format(edges=EDGES))
+
+explorerhat.setup_gpio()
+
+one = explorerhat.input.one
+
+
+def handler(input):
+    pass
+
+
+def old_callback(pin):
+    if one.read() == 1 and callable(one.handle_pressed):
+        one.handle_pressed(one)
+    elif one.read() == 0 and callable(one.handle_released):
+        one.handle_released(one)
+    if callable(one.handle_changed):
+        one.handle_changed(one)
+
+
+def measure(name, callback):
+    t_start = time.time()
+    for edge in range(EDGES):
+        callback(one.pin)
+    t_elapsed = time.time() - t_start
+
+    print("{:<8} {:7.2f}us per edge".format(name, t_elapsed / EDGES * 1000000))
+
+
+one.handle_pressed = handler
+one.handle_released = handler
+one.handle_changed = handler
+one.read()
+
+measure("old", old_callback)
+measure("sampled", one._edge)
+
+stats = one.dispatch_stats()
+print("\nSampled latency {:.2f}us mean {:.2f}us max, handlers {:.2f}us mean".format(
+    stats['mean_latency'] * 1000000, stats['max_latency'] * 1000000, stats['mean_handler_time'] * 1000000))
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+
+import time
+
+import explorerhat
+
+
+READS = 10000
+
+print("""
+Compares reading all four inputs with input.read(), one at a time,
+against input.snapshot(), {reads} times each.
+""".format(reads=READS))
+
+
+def measure(name, function):
+    t_start = time.time()
+    for read in range(READS):
+        function()
+    t_elapsed = time.time() - t_start
+
+    print("{:<10} {:9.0f} reads/sec {:7.2f}us per read".format(name, READS / t_elapsed, t_elapsed / READS * 1000000))
+
+
+explorerhat.input.read()
+
+measure("read()", explorerhat.input.read)
+measure("snapshot()", explorerhat.input.snapshot)
+
+print("\nSnapshot used {}".format("gpiod get_values" if explorerhat.input._lines is not None else "GPIO.input"))
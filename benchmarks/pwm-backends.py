@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import time
+
+import explorerhat
+from explorerhat.pwm import backends
+
+
+DURATION = 5
+UPDATES = 1000
+# Outputs two and three, the only ones on hardware PWM pins, so every backend drives the same pins
+PINS = [explorerhat.OUT2, explorerhat.OUT3]
+
+print("""
+Compares the PWM backends explorerhat can drive outputs with.
+
+For each backend outputs two and three run at 50% for {duration} seconds,
+to measure the CPU it takes just to keep them running, then the duty
+cycle is changed {updates} times to time each update.
+
+CPU is only counted for this process, pigpio does its timing in
+the pigpiod daemon so check that with top as well.
+
+They're on GPIO 12 and 13, the pins 'sysfs' can use, see its dtoverlay
+in explorerhat/pwm.py. Any other pin would fall back to RPi.GPIO.
+
+Update timing is what the animator sees. To measure jitter on the
+waveform itself you'll need a scope or logic analyser on the pins.
+
+Usage: {name} [backend...], from: {backends}
+""".format(duration=DURATION, updates=UPDATES, name=sys.argv[0], backends=', '.join(sorted(backends))))
+
+explorerhat.setup_gpio()
+
+
+def measure(name):
+    try:
+        backend = backends[name]()
+    except KeyError:
+        print("{:<8} unknown backend".format(name))
+        return
+    except (ImportError, RuntimeError) as e:
+        print("{:<8} unavailable: {}".format(name, e))
+        return
+
+    channels = [backend.channel(pin, explorerhat.PULSE_FREQUENCY) for pin in PINS]
+    for channel in channels:
+        channel.start(50)
+
+    cpu_start = sum(os.times()[:2])
+    t_start = time.time()
+    time.sleep(DURATION)
+    cpu = 100.0 * (sum(os.times()[:2]) - cpu_start) / (time.time() - t_start)
+
+    timings = []
+    for update in range(UPDATES):
+        t_start = time.time()
+        channels[update % len(channels)].ChangeDutyCycle(update % 101)
+        timings.append(time.time() - t_start)
+
+    for channel in channels:
+        channel.stop()
+    backend.cleanup()
+
+    mean = sum(timings) / len(timings)
+    deviation = (sum((t - mean) ** 2 for t in timings) / len(timings)) ** 0.5
+
+    print("{:<8} {:6.1f}% CPU idle, update {:7.1f}us mean {:7.1f}us stddev {:7.1f}us max".format(
+        name, cpu, mean * 1000000, deviation * 1000000, max(timings) * 1000000))
+
+
+for name in sys.argv[1:] or sorted(backends):
+    measure(name)
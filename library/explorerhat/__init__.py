@@ -4,7 +4,10 @@ API library for Explorer HAT and Explorer HAT Pro, Raspberry Pi add-on boards"""
 
 import atexit
 import signal
+import threading
 import time
+import traceback
+import warnings
 from sys import version_info
 
 try:
@@ -25,7 +28,14 @@ try:
 except ImportError:
     raise ImportError("This library requires the cap1xxx module\nInstall with: sudo pip install cap1xxx")
 
+from .animation import Animator, Blink, Blinker, Fade, Playback, Pulse, Sequence, gamma_table
+from .buffer import RingBuffer
+from .bus import get_bus
+from .counter import LineEvents, LineValues, PulseCounter
+from .encoder import Encoder
+from .events import EdgeQueue, EdgeStats, monotonic
 from .pins import ObjectCollection, AsyncWorker, StoppableThread
+from .pwm import get_backend, RPiGPIOBackend
 
 
 __version__ = '0.5.1'
@@ -34,6 +44,10 @@ _verbose = False
 _gpio_is_setup = False
 _analog_is_setup = False
 _captouch_is_setup = False
+_analog_setup_lock = threading.Lock()
+_analog_scheduler_lock = threading.Lock()
+_pwm_backend = None
+_edge_queue = None
 
 explorer_pro = False
 explorer_phat = False
@@ -70,9 +84,23 @@ M2F = 26
 # pulsing LEDs per second
 PULSE_FPS = 50
 PULSE_FREQUENCY = 1000
+# Slowest RPi.GPIO PWM frequency to park, its thread
+# can take a couple of periods to notice and exit
+PARK_FREQUENCY = 100
+# Slowest blink left to PWM channels that don't give their own
+# min_frequency, software PWM drifts over longer periods
+BLINK_FREQUENCY = 1
 
 DEBOUNCE_TIME = 20
 
+# Analog full-scale ranges, in millivolts
+PGA_6_144V = 6144
+PGA_4_096V = 4096
+PGA_2_048V = 2048
+PGA_1_024V = 1024
+PGA_0_512V = 512
+PGA_0_256V = 256
+
 CAP_PRODUCT_ID = 107
 
 
@@ -91,20 +119,57 @@ def explorerhat_exit():
     input.stop()
     light.stop()
     light.stop_pulse()
+    motor.stop()
+    animator.stop()
+    blinker.stop()
+
+    if _verbose: print("Stopping analog sampling...")
+    analog_scheduler.stop()
+
+    if _edge_queue is not None:
+        if _verbose: print("Stopping input dispatchers...")
+        set_edge_queue(None)
 
     if _verbose: print("Stopping user tasks...")
     async_stop_all()
 
     if _verbose: print("Cleaning up...")
+    input._release_lines()
+    if _pwm_backend is not None:
+        _pwm_backend.cleanup()
     GPIO.cleanup()
 
     if _verbose: print("Goodbye!")
 
-def setup():
+def setup(pwm_backend=None):
+    """Sets up Explorer HAT
+
+    @param pwm_backend How outputs and motors are driven, see set_pwm_backend()"""
+    if pwm_backend is not None:
+        set_pwm_backend(pwm_backend)
     setup_gpio()
     setup_captouch()
     setup_analog()
 
+def set_pwm_backend(backend):
+    """Chooses how outputs and motors generate PWM
+
+    Must be called before the first output or motor is used.
+
+    @param backend 'rpigpio' ( the default ) for RPi.GPIO software PWM,
+                   'pigpio' for DMA-timed PWM from the pigpio daemon,
+                   'sysfs' for hardware PWM through /sys/class/pwm,
+                   'fake' to drive nothing, or a backend instance from explorerhat.pwm"""
+    global _pwm_backend
+    _pwm_backend = get_backend(backend)
+    return _pwm_backend
+
+def get_pwm_backend():
+    global _pwm_backend
+    if _pwm_backend is None:
+        _pwm_backend = RPiGPIOBackend()
+    return _pwm_backend
+
 def setup_gpio(pin=None, mode=None, initial=0):
     global _gpio_is_setup
 
@@ -134,25 +199,83 @@ def setup_captouch():
     except IOError:
         has_captouch = False
 
+    if has_captouch and hasattr(_cap1208, 'i2c'):
+        # Share the locked bus with the ADC rather than racing it on a handle of our own
+        own_bus, _cap1208.i2c = _cap1208.i2c, get_bus()
+        if hasattr(own_bus, 'close'):
+            own_bus.close()
+
     return has_captouch
 
-def setup_analog():
-    global _analog_is_setup, adc_available, read_se_adc, has_analog
+def setup_analog(force_chip=None, ready_pin=None):
+    """Detect the ADC, caching whether it's an ADS1015 or ADS1115
+
+    @param force_chip Skip detection and assume an "ADS1015" or "ADS1115" is fitted
+    @param ready_pin BCM GPIO pin wired to the ADC's ALERT/RDY, if you've connected it"""
+    global _analog_is_setup, adc_available, ads1015, read_se_adc, read_raw, stream_se_adc, has_analog
 
     if _analog_is_setup:
         return has_analog
 
-    _analog_is_setup = True
+    # Other threads must wait for detection to finish, rather than see the ADC as missing
+    with _analog_setup_lock:
+        if _analog_is_setup:
+            return has_analog
 
-    from .ads1015 import read_se_adc, adc_available 
+        from . import ads1015
+        from .ads1015 import read_se_adc, read_raw, stream_se_adc
 
-    if adc_available:
-        has_analog = True
-    else:
-        has_analog = False
+        adc_available = ads1015.setup(force_chip)
+
+        if adc_available and ready_pin is not None:
+            setup_gpio(ready_pin, GPIO.IN)
+
+            def wait_for_ready(timeout):
+                # ALERT/RDY is active low and stays low once the conversion is done
+                if GPIO.input(ready_pin) == 0:
+                    return True
+                return GPIO.wait_for_edge(ready_pin, GPIO.FALLING, timeout=int(timeout * 1000) + 1) is not None
+
+            ads1015.set_ready_pin(wait_for_ready)
+
+        if adc_available:
+            has_analog = True
+        else:
+            has_analog = False
+
+        _analog_is_setup = True
 
     return has_analog
 
+def set_edge_queue(size=256, dispatchers=1):
+    """Queues input edges for a pool of threads to handle, rather than handling them as they arrive
+
+    Handlers normally run on RPi.GPIO's event thread, so a slow one
+    stops later edges being seen. Queued, edges are timestamped and
+    their level read as they arrive, and handled as soon as a
+    dispatcher is free. If "size" edges are already waiting, new ones
+    are dropped and counted, see edge_queue_stats().
+
+    However many dispatchers there are, each input handles one edge at a
+    time, so handlers always see that edge's level and timestamp.
+
+    @param size Most edges to hold, or None to go back to handling edges as they arrive
+    @param dispatchers Number of threads running handlers. More than one can run them out of order"""
+    global _edge_queue
+
+    old_queue = _edge_queue
+    _edge_queue = EdgeQueue(size, dispatchers) if size is not None else None
+
+    if old_queue is not None:
+        old_queue.stop()
+
+def edge_queue_stats():
+    """Returns a dict of edges queued, dropped, waiting now and the most ever waiting, or None if edges aren't queued"""
+    edge_queue = _edge_queue
+    if edge_queue is None:
+        return None
+    return edge_queue.stats()
+
 def is_explorer_pro():
     setup_analog()
     setup_captouch()
@@ -169,70 +292,6 @@ def is_explorer_phat():
     return has_analog and not has_captouch
 
 
-class Pulse(StoppableThread):
-    """Basic thread wrapper class for delta-timed LED pulsing
-
-    Pulses an LED in perfect wall-clock time
-    Small delay by 1.0/FPS to prevent unnecessary workload"""
-    def __init__(self, pin, time_on, time_off, transition_on, transition_off):
-        StoppableThread.__init__(self)
-
-        self._paused = False
-        self.pin = pin
-        self.time_on = time_on
-        self.time_off = time_off
-        self.transition_on = transition_on
-        self.transition_off = transition_off
-
-        self.fps = PULSE_FPS
-
-        # Total time of transition
-        self.time_start = time.time()
-
-    def start(self):
-        self.pin.frequency(PULSE_FREQUENCY)
-
-        if self._paused:
-            self.time_start = time.time()
-            self._paused = False
-            return
-
-        self.time_start = time.time()
-        StoppableThread.start(self)
-
-    def pause(self):
-        self._paused = True
-
-    def run(self):
-        # This loop runs at the specified "FPS" uses time.time()
-        while not self.stop_event.is_set():
-            if not self._paused:
-                current_time = time.time() - self.time_start
-                delta = current_time % (self.transition_on+self.time_on+self.transition_off+self.time_off)
-
-                time_off = self.transition_on + self.time_on + self.transition_off
-                time_on = self.transition_on + self.time_on
-
-                if delta <= self.transition_on:
-                    # Transition On Phase
-                    self.pin.duty_cycle(round((100.0 / self.transition_on) * delta))
-
-                elif time_on < delta <= time_off:
-                    # Transition Off Phase
-                    current_delta = delta - self.transition_on - self.time_on
-                    self.pin.duty_cycle(round(100.0 - ((100.0 / self.transition_off) * current_delta)))
-
-                elif delta > self.transition_on < delta <= time_on:
-                    self.pin.duty_cycle(100)
-
-                elif delta > time_off:
-                    self.pin.duty_cycle(0)
-
-            time.sleep(1.0/self.fps)
-
-        self.pin.duty_cycle(0)
-
-
 class Pin(object):
     """ExplorerHAT class representing a GPIO Pin
 
@@ -260,8 +319,9 @@ class Pin(object):
         setup_gpio(self.pin, self.mode)
 
     def has_changed(self):
-        if self.read() != self.last:
-            self.last = self.read()
+        level = self.read()
+        if level != self.last:
+            self.last = level
             return True
         return False
 
@@ -281,7 +341,7 @@ class Pin(object):
     def __enter__(self):
         return self
 
-    def __exit__(self, type, value, traceback):
+    def __exit__(self, type, value, tb):
         pass
 
     def __del__(self):
@@ -307,13 +367,14 @@ class Motor(object):
             return
 
         self._gpio_is_setup = True
-        setup_gpio(self.pin_fw, GPIO.OUT, initial=GPIO.LOW)
-        setup_gpio(self.pin_bw, GPIO.OUT, initial=GPIO.LOW)
+        setup_gpio()
 
-        self.pwm_fw = GPIO.PWM(self.pin_fw, 100)
+        backend = get_pwm_backend()
+
+        self.pwm_fw = backend.channel(self.pin_fw, 100)
         self.pwm_fw.start(0)
 
-        self.pwm_bw = GPIO.PWM(self.pin_bw, 100)
+        self.pwm_bw = backend.channel(self.pin_bw, 100)
         self.pwm_bw.start(0)
 
     def invert(self):
@@ -358,7 +419,9 @@ class Motor(object):
         return speed
 
     def stop(self):
-        self.speed(0)
+        # Nothing to stop if the motor was never used
+        if self._gpio_is_setup:
+            self.speed(0)
 
     forward = forwards
     backward = backwards
@@ -377,6 +440,21 @@ class Input(Pin):
         self.handle_released = None
         self.handle_changed = None
         self.has_callback = False
+        # Level and monotonic time of the edge being handled, for handlers to read
+        self.level = None
+        self.timestamp = None
+        self.stats = EdgeStats()
+        # Handlers read level and timestamp from the input, so only one edge is handled at a time
+        self._dispatch_lock = threading.Lock()
+        # See start_counting()
+        self.counter = None
+        # gpiod line events this input's edges come from, maybe shared with other inputs
+        self._line_events = None
+        # Handlers' debounce time in seconds, RPi.GPIO's edges come debounced but line events don't
+        self._bouncetime = 0
+        self._last_edge = None
+        # Called with ( timestamp, level ) for every edge, before any handlers
+        self._listeners = []
 
         super(Input, self).__init__(pin, GPIO.IN)
 
@@ -389,18 +467,148 @@ class Input(Pin):
         if self.has_callback:
             return False
 
-        def handle_callback(pin):
-            if self.read() == 1 and callable(self.handle_pressed):
+        self._bouncetime = bouncetime / 1000.0
+
+        if self._line_events is not None:
+            # RPi.GPIO can't detect edges on a line gpiod holds, but its line events bring every edge anyway
+            self._last_edge = None
+            self.has_callback = True
+            return True
+
+        # RPi.GPIO can't detect edges on lines held for input.snapshot()
+        input._release_lines()
+
+        self._setup_gpio()
+        if bouncetime:
+            GPIO.add_event_detect(self.pin, GPIO.BOTH, callback=self._edge, bouncetime=bouncetime)
+        else:
+            GPIO.add_event_detect(self.pin, GPIO.BOTH, callback=self._edge)
+        self.has_callback = True
+        return True
+
+    def _edge(self, pin):
+        # Sample once, so a fast signal can't change between deciding pressed/released and changed
+        self._handle_edge(monotonic(), GPIO.input(self.pin))
+
+    def _handle_edge(self, timestamp, level):
+        if self._listeners:
+            for listener in self._listeners:
+                listener(timestamp, level)
+            if not (self.handle_pressed or self.handle_released or self.handle_changed):
+                return
+
+        if self._line_events is not None and self._bouncetime:
+            # Debounce as RPi.GPIO would, from the last edge handled
+            if self._last_edge is not None and timestamp - self._last_edge < self._bouncetime:
+                return
+            self._last_edge = timestamp
+
+        edge_queue = _edge_queue
+        if edge_queue is not None:
+            edge_queue.put(self, timestamp, level)
+        else:
+            self._dispatch(timestamp, level)
+
+    def _add_listener(self, listener):
+        self._listeners.append(listener)
+        if self._line_events is None:
+            self._setup_callback(0)
+
+    def _remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+        self._release_line_events()
+
+    def _start_line_events(self, others=()):
+        """Reads edges on this input, and any others, from one gpiod line events thread
+
+        Edges on every input arrive in order on that thread, for listeners
+        and handlers alike. Inputs already reading line events are moved
+        across, along with any others sharing them.
+        Returns False if there's no gpiod, a line is busy, or RPi.GPIO
+        is already detecting edges on one of the inputs.
+
+        @param self Object pointer.
+        @param others Other inputs to read alongside this one"""
+        inputs = [self] + [i for i in others if i is not self]
+        old = set(i._line_events for i in inputs)
+
+        if len(old) == 1 and None not in old:
+            return True
+
+        if any(i.has_callback and i._line_events is None for i in inputs):
+            return False
+
+        old.discard(None)
+        inputs += [i for i in input if i not in inputs and i._line_events in old]
+
+        for line_events in old:
+            line_events.stop()
+
+        # The lines can't be held for input.snapshot() too
+        input._release_lines()
+
+        pins = dict((i.pin, i) for i in inputs)
+        try:
+            line_events = LineEvents(list(pins), lambda pin, timestamp, level: pins[pin]._handle_edge(timestamp, level), edge='both')
+        except (ImportError, OSError, RuntimeError):
+            # No gpiod, or a line is busy, anything we stopped goes over to RPi.GPIO
+            for i in inputs:
+                if i._line_events is not None:
+                    i._line_events = None
+                    i._use_gpio_edges()
+            return False
+
+        for i in inputs:
+            i._line_events = line_events
+        line_events.start()
+        return True
+
+    def _use_gpio_edges(self):
+        # Line events gone, so detect edges with RPi.GPIO for whatever still needs them
+        if self.has_callback:
+            self.has_callback = False
+            self._setup_callback(int(round(self._bouncetime * 1000)))
+        elif self._listeners:
+            self._setup_callback(0)
+
+    def _release_line_events(self):
+        # Stops this input's line events once nothing on any input they read needs them
+        line_events = self._line_events
+        if line_events is None:
+            return
+
+        inputs = [self] + [i for i in input if i is not self and i._line_events is line_events]
+        if any(i._listeners or i.has_callback for i in inputs):
+            return
+
+        line_events.stop()
+        for i in inputs:
+            i._line_events = None
+
+    def _dispatch(self, timestamp, level):
+        with self._dispatch_lock:
+            t_dispatch = monotonic()
+
+            self.level = level
+            self.timestamp = timestamp
+
+            if level == 1 and callable(self.handle_pressed):
                 self.handle_pressed(self)
-            elif self.read() == 0 and callable(self.handle_released):
+            elif level == 0 and callable(self.handle_released):
                 self.handle_released(self)
             if callable(self.handle_changed):
                 self.handle_changed(self)
 
-        self._setup_gpio()
-        GPIO.add_event_detect(self.pin, GPIO.BOTH, callback=handle_callback, bouncetime=bouncetime)
-        self.has_callback = True
-        return True
+            self.stats.edge(t_dispatch - timestamp, monotonic() - t_dispatch)
+
+    def dispatch_stats(self):
+        """Returns how many edges have been handled, how long after the edge and how long the handlers took
+
+        Times are in seconds.
+
+        @param self Object pointer."""
+        return self.stats.as_dict()
 
     def on_low(self, callback, bouncetime=DEBOUNCE_TIME):
         self.handle_released = callback
@@ -412,10 +620,83 @@ class Input(Pin):
         self._setup_callback(bouncetime)
         return True
 
+    def start_counting(self, history=1024):
+        """Starts counting pulses, without running any Python per pulse if it can be avoided
+
+        Uses the kernel's gpiochip line events through gpiod if it's installed,
+        and carries on with them if on_changed/on_high/on_low are used later.
+        Otherwise pulses are counted on RPi.GPIO's event thread, which shares
+        edge detection with on_changed/on_high/on_low, and their debounce time
+        if they came first.
+
+        @param self Object pointer.
+        @param history Number of pulse timestamps kept for frequency()"""
+        if self.counter is not None:
+            return True
+
+        self.counter = PulseCounter(history)
+
+        if not self._start_line_events() and self.has_callback and self._bouncetime:
+            warnings.warn("Input {} is counting through RPi.GPIO with a {:.0f}ms debounce, so can't count faster than {:.0f}Hz. "
+                          "Install gpiod, or start counting before adding handlers".format(
+                              self.pin, self._bouncetime * 1000, 0.5 / self._bouncetime))
+
+        self._add_listener(self.counter.edge)
+        return True
+
+    def stop_counting(self):
+        """Stops counting pulses, and forgets the count
+
+        @param self Object pointer."""
+        if self.counter is not None:
+            self._remove_listener(self.counter.edge)
+        self.counter = None
+
+    def count(self):
+        """Returns the number of pulses ( rising edges ) counted, starting counting if it wasn't already
+
+        @param self Object pointer."""
+        self.start_counting()
+        return self.counter.count()
+
+    def frequency(self, window=1.0):
+        """Returns the frequency of pulses in Hz, starting counting if it wasn't already
+
+        @param self Object pointer.
+        @param window Measure over the pulses from the last "window" seconds"""
+        self.start_counting()
+        return self.counter.frequency(window)
+
+    def reset(self):
+        """Sets the pulse count back to 0
+
+        @param self Object pointer."""
+        self.start_counting()
+        self.counter.reset()
+        return True
+
+    def stop(self):
+        self.stop_counting()
+        return True
+
     def clear_events(self):
-        if self._is_gpio_setup():
+        if self._line_events is not None:
+            self.handle_pressed = None
+            self.handle_released = None
+            self.handle_changed = None
+            self.has_callback = False
+            self._release_line_events()
+            return
+
+        if self.has_callback:
             GPIO.remove_event_detect(self.pin)
         self.has_callback = False
+        if self._listeners:
+            self.handle_pressed = None
+            self.handle_released = None
+            self.handle_changed = None
+            # Keep counting and decoding on our own edge detection
+            self._setup_callback(0)
 
     # Alias handlers
     changed = on_changed
@@ -433,58 +714,158 @@ class Output(Pin):
     def __init__(self, pin):
         super(Output, self).__init__(pin, GPIO.OUT)
 
-        self.pulser = Pulse(self, 0, 0, 0, 0)
+        self.pulser = Pulse(0, 0, 0, 0)
         self.blinking = False
-        self.pulsing = False
-        self.fading = False
-        self.fader = None
+        # Duty cycle for each brightness 0 to 100, see gamma()
+        self._gamma = 1.0
+        self._gamma_table = gamma_table(1.0)
         self._value = 0
+        self.backend = None
         self.gpio_pwm = None
+        self._frequency = None
+        self._duty_cycle = None
+        # Number of frequency/duty cycle changes skipped because nothing would have changed
+        self.suppressed_writes = 0
 
     def _setup_gpio(self):
         if self._is_gpio_setup:
             return True
 
-        setup_gpio(self.pin, self.mode)
-        self.gpio_pwm = GPIO.PWM(self.pin, PULSE_FREQUENCY)
-        self.gpio_pwm.start(0)
+        setup_gpio()
+        # The backend sets the pin up itself, hardware PWM pins mustn't be made plain outputs
+        self.backend = get_pwm_backend()
+        # Not started until we need it, see _park()
+        self.gpio_pwm = self.backend.channel(self.pin, PULSE_FREQUENCY)
+        self._pwm_running = False
+        # Slowest frequency since the PWM last started, which its thread may still be sleeping through
+        self._slowest_frequency = PULSE_FREQUENCY
+        # When the PWM thread of the last park() is sure to have exited
+        self._parked_until = 0
+        # Timer for a start() that had to wait for that
+        self._restart = None
+        self._frequency = PULSE_FREQUENCY
+        self._duty_cycle = 0
         self._is_gpio_setup = True
 
+    def _start_pwm(self):
+        # RPi.GPIO's PWM thread only exits when it next wakes after stop(), and
+        # starting again before then reuses its state, leaving two threads on one pin.
+        # This may be the animator or blinker thread, so start later rather than wait
+        wait = self._parked_until - monotonic()
+        if wait > 0:
+            if self._restart is None:
+                self._restart = threading.Timer(wait, self._restart_pwm)
+                self._restart.daemon = True
+                self._restart.start()
+            return
+
+        # RPi.GPIO forgets the frequency once stopped, so set it again
+        self.gpio_pwm.start(self._duty_cycle)
+        self.gpio_pwm.ChangeFrequency(self._frequency)
+        self._slowest_frequency = self._frequency
+        self._pwm_running = True
+
+    def _restart_pwm(self):
+        self._restart = None
+        # Parked again while we waited, nothing to do
+        if not self._pwm_running and self._duty_cycle != 0:
+            self._start_pwm()
+
+    def _park(self):
+        """Stops the software PWM thread while the output is off
+
+        RPi.GPIO's PWM thread keeps waking up even at 0% duty cycle,
+        so an idle output holds its pin low instead and costs nothing.
+        The same PWM object is restarted next time it's needed.
+
+        Below PARK_FREQUENCY the thread could take seconds to exit,
+        so it's left running rather than hold up the next start."""
+        if self._pwm_running and self._duty_cycle == 0:
+            software = isinstance(self.gpio_pwm, GPIO.PWM)
+            if software and self._slowest_frequency < PARK_FREQUENCY:
+                return
+
+            self.gpio_pwm.stop()
+            self._pwm_running = False
+            if software:
+                # Allow two periods for its thread to notice and exit
+                self._parked_until = monotonic() + 2.0 / self._slowest_frequency
+
     def __del__(self):
         if self.gpio_pwm is not None:
             self.gpio_pwm.stop()
         Pin.__del__(self)
 
-    def fade(self, start, end, duration):
-        """Fades an LED to a specific brightness over a specific time in seconds
+    def read(self):
+        self._setup_gpio()
+        return self.backend.read(self.pin)
+
+    @property
+    def pulsing(self):
+        return animator.get(self) is self.pulser
+
+    @property
+    def fading(self):
+        return isinstance(animator.get(self), Fade)
+
+    def gamma(self, gamma=2.2):
+        """Sets the gamma used to turn brightness into duty cycle
+
+        LEDs look much brighter than their duty cycle at the dim end,
+        a gamma of around 2.2 makes brightness, fades and pulses look even.
+        The default of 1.0 uses brightness as the duty cycle.
 
         @param self Object pointer.
-        @param start Starting brightness %
-        @param end Ending brightness %
-        @param duration Time duration ( in seconds ) of the fade"""
-        self.stop()
-        time_start = time.time()
-        self.pwm(PULSE_FREQUENCY, start)
+        @param gamma Gamma, greater than 0"""
+        self._gamma_table = gamma_table(gamma)
+        self._gamma = gamma
+
+        animation = animator.get(self)
+        if animation is not None:
+            # Redraw the running animation with the new table
+            animator.add(self, animation)
+        return True
+
+    def _show(self, brightness):
+        # brightness must be an int from 0 to 100, everything on the animator's tables is
+        self.duty_cycle(self._gamma_table[brightness])
 
-        def _fade():
-            self.fading = True
+    def animation_stats(self):
+        """Returns frame timing for the running pulse, fade or blink, or None if nothing is animating
 
-            if time.time() - time_start >= duration:
-                self.duty_cycle(end)
-                self.fading = False
-                return False
+        Gives the number of frames drawn and dropped, plus the mean, maximum
+        and total time in seconds each frame was drawn after its deadline.
+        A blink's frames are its edges, so total_jitter is its cumulative phase error.
+
+        @param self Object pointer."""
+        animation = animator.get(self) or blinker.get(self)
+        if animation is None:
+            return None
+        return animation.stats.as_dict()
 
-            current = (time.time() - time_start) / duration
-            brightness = start + (float(end-start) * current)
-            self.duty_cycle(round(brightness))
-            time.sleep(1.0 / PULSE_FPS)
+    def fade(self, start, end, duration, curve='linear'):
+        """Fades an LED to a specific brightness over a specific time in seconds
+
+        @param self Object pointer.
+        @param start Starting brightness %
+        @param end Ending brightness %
+        @param duration Time duration ( in seconds ) of the fade
+        @param curve Shape of the fade, one of 'linear', 'sine' or 'ease-in-out'"""
+        if not 0 <= start <= 100 or not 0 <= end <= 100:
+            raise ValueError("Brightness must be between 0 and 100")
 
-        self.fader = AsyncWorker(_fade)
-        self.fader.start()
+        self.stop()
+        self.frequency(PULSE_FREQUENCY)
+        self._show(int(round(start)))
+        animator.add(self, Fade(start, end, duration, curve))
         return True
 
     def blink(self, on=1, off=-1):
-        """Blinks an LED by working out the correct PWM frequency/duty cycle
+        """Blinks an LED
+
+        Blinks the PWM backend can go slow enough for are left to PWM,
+        slower ones are timed by the blinker thread against monotonic deadlines.
+        Either way, the output is fully on then fully off, so gamma doesn't apply.
 
         @param self Object pointer.
         @param on Time the LED should stay at 100%/on
@@ -500,23 +881,34 @@ class Output(Pin):
 
         total = off + on
 
-        duty_cycle = 100.0 * (on/total)
+        if on == 0 or off == 0:
+            # Never off is steady on, never on is steady off
+            self.frequency(PULSE_FREQUENCY)
+            self.duty_cycle(100 if off == 0 and on > 0 else 0)
+            self._park()
+            return True
+
+        if 1.0 / total >= getattr(self.gpio_pwm, 'min_frequency', BLINK_FREQUENCY):
+            self.frequency(1.0 / total)
+            self.duty_cycle(100.0 * (on / total))
+        else:
+            # Too slow for the PWM to hold without drifting, so toggle at fixed deadlines instead
+            self.frequency(PULSE_FREQUENCY)
+            blinker.add(self, Blink(on, off))
 
-        # Use pure PWM blinking, because threads are ugly
-        self.frequency(1.0/total)
-        self.duty_cycle(duty_cycle)
         self.blinking = True
 
         return True
 
-    def pulse(self, transition_on=None, transition_off=None, time_on=None, time_off=None):
+    def pulse(self, transition_on=None, transition_off=None, time_on=None, time_off=None, curve='linear'):
         """Pulses an LED
 
         @param self Object pointer.
         @param transition_on Time the transition from 0% to 100% brightness should take
         @param transition_off Time the trantition from 100% to 0% brightness should take
         @param time_on Time the LED should stay at 100% brightness
-        @param time_off Time the LED should stay at 0% brightness"""
+        @param time_off Time the LED should stay at 0% brightness
+        @param curve Shape of the transitions, one of 'linear', 'sine' or 'ease-in-out'"""
 
         self.stop()
 
@@ -547,37 +939,63 @@ class Output(Pin):
             self.pulser.time_off = time_off
             self.pulser.transition_on = transition_on
             self.pulser.transition_off = transition_off
+            self.pulser.curve = curve
             self.pulser.start()
-            self.pulsing = True
+            self.frequency(PULSE_FREQUENCY)
+            animator.add(self, self.pulser)
 
         return True
 
+    def play(self, sequence):
+        """Plays a Sequence of keyframes
+
+        @param self Object pointer.
+        @param sequence An explorerhat.Sequence"""
+        self.stop()
+        self.frequency(PULSE_FREQUENCY)
+        animator.add(self, Playback(sequence))
+        return True
+
     def pwm(self, freq, duty_cycle=50):
-        self.gpio_pwm.ChangeDutyCycle(duty_cycle)
-        self.gpio_pwm.ChangeFrequency(freq)
+        self.duty_cycle(duty_cycle)
+        self.frequency(freq)
         return True
 
     def frequency(self, freq):
-        self.gpio_pwm.ChangeFrequency(freq)
+        self._setup_gpio()
+
+        if freq == self._frequency:
+            self.suppressed_writes += 1
+            return True
+
+        self._frequency = freq
+        if self._pwm_running:
+            self.gpio_pwm.ChangeFrequency(freq)
+            self._slowest_frequency = min(self._slowest_frequency, freq)
         return True
 
     def duty_cycle(self, duty_cycle):
-        self.gpio_pwm.ChangeDutyCycle(duty_cycle)
+        self._setup_gpio()
+
+        if duty_cycle == self._duty_cycle:
+            self.suppressed_writes += 1
+            return True
+
+        self._duty_cycle = duty_cycle
+        if self._pwm_running:
+            self.gpio_pwm.ChangeDutyCycle(duty_cycle)
+        else:
+            self._start_pwm()
         return True
 
     def stop(self):
         """Spops all animation"""
         self._setup_gpio()
 
-        if self.fading:
-            self.fader.stop()
-            self.fading = False
-
-        if self.pulsing:
-            self.pulsing = False
-            self.pulser.pause()
+        animator.remove(self)
 
         if self.blinking:
+            blinker.remove(self)
             self.blinking = False
 
         if self._value:
@@ -585,22 +1003,32 @@ class Output(Pin):
         else:
             self.duty_cycle(0)
 
+        self._park()
+
         return True
 
     def stop_pulse(self):
-        """Stops the pulsing thread
+        """Stops pulsing, leaving the output off
 
         @param self Object pointer."""
-        self.pulsing = False
-        self.pulser.stop()
-        self.pulser = Pulse(self, 0, 0, 0, 0)
+        if animator.remove(self) is self.pulser:
+            self.duty_cycle(0)
+            self._park()
 
     def brightness(self, value):
         if not 0 <= value <= 100:
             raise ValueError("Brightness must be between 0 and 100")
 
         self.frequency(PULSE_FREQUENCY)
-        self.duty_cycle(value)
+
+        # Between the table's whole percents, so 12.5 is still 12.5% at a gamma of 1.0
+        table = self._gamma_table
+        index = int(value)
+        if index == 100:
+            self.duty_cycle(table[100])
+        else:
+            self.duty_cycle(table[index] + (table[index + 1] - table[index]) * (value - index))
+        self._park()
 
     def write(self, value):
         if value not in [True, False]:
@@ -616,6 +1044,8 @@ class Output(Pin):
         else:
             self.duty_cycle(0)
 
+        self._park()
+
         return True
 
     def on(self):
@@ -653,39 +1083,384 @@ class Light(Output):
         super(Light, self).__init__(pin)
 
 
+class InputCollection(ObjectCollection):
+    """Collection of Inputs which can all be read at once"""
+
+    def __init__(self, **kwargs):
+        ObjectCollection.__init__(self, **kwargs)
+        self._lines = None
+        self._lines_failed = False
+        # Pins to read one after another, once they're set up
+        self._pins = None
+
+    def _release_lines(self):
+        if self._lines is not None:
+            self._lines.release()
+            self._lines = None
+
+    def snapshot(self):
+        """Reads every input as close to the same instant as possible
+
+        Uses one gpiochip get_values call through gpiod if it's installed
+        and no input is watching for edges, otherwise reads each input
+        straight after the last.
+
+        Returns ( bitmask, timestamp ) with bit 0 for input one, bit 1 for
+        input two and so on, timestamp from time.monotonic() if available.
+
+        @param self Object pointer."""
+        if self._lines is None and not self._lines_failed:
+            inputs = list(self)
+            if not any(i.has_callback or i._line_events is not None for i in inputs):
+                try:
+                    self._lines = LineValues([i.pin for i in inputs])
+                except (ImportError, OSError, RuntimeError):
+                    # No gpiod, or the lines are busy, don't try again
+                    self._lines_failed = True
+
+        if self._lines is not None:
+            t_start = monotonic()
+            levels = self._lines.get_values()
+            t_end = monotonic()
+
+        else:
+            if self._pins is None:
+                for i in self:
+                    i._setup_gpio()
+                self._pins = [i.pin for i in self]
+
+            read = GPIO.input
+            pins = self._pins
+
+            t_start = monotonic()
+            levels = [read(pin) for pin in pins]
+            t_end = monotonic()
+
+        bitmask = 0
+        for bit, level in enumerate(levels):
+            if level:
+                bitmask |= 1 << bit
+
+        return bitmask, (t_start + t_end) / 2
+
+    def count(self):
+        # ObjectCollection.count() means something else, we want each input's pulse count
+        return self._do('count')
+
+
+class OutputCollection(ObjectCollection):
+    """Collection of Outputs which can be animated in step
+
+    Every member runs off one timebase, optionally delayed by a phase offset for chase effects"""
+
+    def _synchronise(self, phase):
+        if isinstance(phase, (list, tuple)):
+            offsets = phase
+        else:
+            offsets = [index * phase for index in range(len(self._index))]
+
+        offsets = dict(zip(self, offsets))
+        animator.synchronise(offsets)
+        blinker.synchronise(offsets)
+
+    def pulse(self, transition_on=None, transition_off=None, time_on=None, time_off=None, curve='linear', phase=0):
+        """Pulses every output in step
+
+        @param self Object pointer.
+        @param phase Seconds to delay each output by after the one before, or a list of delays"""
+        result = self._do('pulse', transition_on, transition_off, time_on, time_off, curve)
+        self._synchronise(phase)
+        return result
+
+    def blink(self, on=1, off=-1, phase=0):
+        """Blinks every output in step
+
+        @param self Object pointer.
+        @param phase Seconds to delay each output by after the one before, or a list of delays"""
+        result = self._do('blink', on, off)
+        self._synchronise(phase)
+        return result
+
+    def play(self, sequence, phase=0):
+        """Plays a Sequence on every output in step
+
+        @param self Object pointer.
+        @param sequence An explorerhat.Sequence
+        @param phase Seconds to delay each output by after the one before, or a list of delays"""
+        result = self._do('play', sequence)
+        self._synchronise(phase)
+        return result
+
+
+class AnalogScheduler(StoppableThread):
+    """Single thread which owns the ADC
+
+    Reads every subscribed AnalogInput at its own rate, batching any that
+    are due together into one scan, and hands the results back to each
+    input to buffer and dispatch change events.
+    Sleeps until the next reading is due, and blocks entirely when
+    nothing is subscribed."""
+    def __init__(self):
+        StoppableThread.__init__(self)
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        # AnalogInput: [period, next deadline], deadlines are monotonic so a clock step can't stall sampling
+        self.subscribers = {}
+        # Scans that failed on the bus, only the first of a run is reported
+        self.errors = 0
+        self.failing = False
+
+    def subscribe(self, analog_input, rate):
+        with self.lock:
+            self.subscribers[analog_input] = [1.0 / rate, monotonic()]
+        self.wake.set()
+        self.start()
+
+    def unsubscribe(self, analog_input):
+        with self.lock:
+            self.subscribers.pop(analog_input, None)
+        self.wake.set()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake.set()
+        StoppableThread.stop(self)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            now = monotonic()
+
+            with self.lock:
+                due = [i for i in self.subscribers if self.subscribers[i][1] <= now]
+                deadlines = [self.subscribers[i][1] for i in due]
+                pending = [s[1] for s in self.subscribers.values() if s[1] > now]
+
+            if not due:
+                self.wake.wait(min(pending) - now if pending else None)
+                self.wake.clear()
+                continue
+
+            try:
+                values, timestamps = ads1015.scan([ads1015.conversion(i.channel, i._gain, i._sps) for i in due])
+            except IOError:
+                # A glitch on the bus mustn't stop sampling for good, try again at the next readings
+                self.errors += 1
+                if not self.failing:
+                    traceback.print_exc()
+                self.failing = True
+                values = None
+            else:
+                self.failing = False
+
+            with self.lock:
+                for analog_input in due:
+                    schedule = self.subscribers.get(analog_input)
+                    if schedule is not None:
+                        # Skip readings we've missed rather than bunching up
+                        schedule[1] = max(schedule[1] + schedule[0], now)
+
+            if values is None:
+                continue
+
+            for index, analog_input in enumerate(due):
+                analog_input._sample(timestamps[index], values[index], deadlines[index])
+
+
 class AnalogInput(object):
     type = 'Analog Input'
 
     def __init__(self, channel):
         self.channel = channel
         self._sensitivity = 0.1
-        self._t_watch = None
         self.last_value = None
         self._handler = None
-
-    def read(self):
+        self._gain = PGA_6_144V
+        self._sps = 250
+        self._watch_rate = None
+        self._sample_rate = None
+        # Rate the scheduler reads at, the faster of the two above
+        self._read_rate = None
+        # Scheduler deadline the next buffered sample is due at
+        self._sample_due = None
+        self._filter = None
+        self.buffer = None
+
+    def _setup_analog(self):
         if not setup_analog():
             raise RuntimeError("Analog is unavailable, check your pHAT/HAT and/or connections!")
-        return read_se_adc(self.channel)
+
+    def configure(self, gain=None, sps=None):
+        """Sets the gain and sample rate used by this input
+
+        @param self Object pointer.
+        @param gain Full-scale range in millivolts, one of the explorerhat.PGA_* constants
+        @param sps Samples per second, 128 to 3300 on the ADS1015 or 8 to 860 on the ADS1115"""
+        self._setup_analog()
+
+        if gain is None:
+            gain = self._gain
+        if sps is None:
+            sps = self._sps
+
+        # Raises a ValueError for anything the ADC can't do
+        ads1015.conversion(self.channel, gain, sps)
+
+        self._gain = gain
+        self._sps = sps
+
+        return True
+
+    def read(self):
+        self._setup_analog()
+        return read_se_adc(self.channel, self._gain, self._sps)
+
+    def read_raw(self):
+        """Returns the signed conversion result without scaling it to volts
+
+        @param self Object pointer."""
+        self._setup_analog()
+        return read_raw(self.channel, self._gain, self._sps)
+
+    def stream(self, sps=None, count=None):
+        """Yields readings using the ADC's continuous conversion mode
+
+        @param self Object pointer.
+        @param sps Samples per second, defaults to the rate set with configure()
+        @param count Number of samples to take, or None to run until the generator is closed"""
+        self._setup_analog()
+        if sps is None:
+            sps = self._sps
+        return stream_se_adc(self.channel, self._gain, sps, count)
 
     def sensitivity(self, sensitivity):
         self._sensitivity = sensitivity
 
-    def changed(self, handler, sensitivity=None):
+    def filter(self, analog_filter):
+        """Smooths background readings before they're buffered or checked for changes
+
+        @param self Object pointer.
+        @param analog_filter A filter from explorerhat.filters, or None to remove it"""
+        if analog_filter is not None:
+            analog_filter.reset()
+        self._filter = analog_filter
+        return True
+
+    def changed(self, handler, sensitivity=None, rate=100):
+        """Calls handler( input, value ) whenever the reading moves by more than sensitivity
+
+        @param self Object pointer.
+        @param handler Function to call
+        @param sensitivity Change in volts to react to
+        @param rate Readings per second to check for changes"""
+        self._setup_analog()
         self._handler = handler
         if sensitivity is not None:
             self._sensitivity = sensitivity
-        if self._t_watch is None:
-            self._t_watch = AsyncWorker(self._watch)
-            self._t_watch.start()
+        self._watch_rate = rate
+        self._subscribe()
 
-    def _watch(self):
-        value = self.read()
-        if self.last_value is not None and abs(value-self.last_value) > self._sensitivity:
-            if callable(self._handler):
-                self._handler(self, value)
-        self.last_value = value
-        time.sleep(0.01)
+    def clear_events(self):
+        """Stops watching for changes
+
+        @param self Object pointer."""
+        self._handler = None
+        self._watch_rate = None
+        self.last_value = None
+        self._subscribe()
+        return True
+
+    def start_sampling(self, rate=100, size=1000):
+        """Samples this input in the background into a ring buffer
+
+        Use latest(), window() or buffer.memoryview() to read
+        the history without touching the ADC.
+
+        @param self Object pointer.
+        @param rate Samples per second to take
+        @param size Number of samples to keep"""
+        self._setup_analog()
+        self.buffer = RingBuffer(size)
+        self._sample_rate = rate
+        self._sample_due = None
+        self._subscribe()
+        return True
+
+    def stop_sampling(self):
+        """Stops background sampling, the buffer is kept until sampling restarts
+
+        @param self Object pointer."""
+        self._sample_rate = None
+        self._subscribe()
+        return True
+
+    def _subscribe(self):
+        rates = [r for r in (self._watch_rate, self._sample_rate) if r is not None]
+        if rates:
+            self._read_rate = max(rates)
+            get_analog_scheduler().subscribe(self, self._read_rate)
+        else:
+            self._read_rate = None
+            get_analog_scheduler().unsubscribe(self)
+
+    def _sample(self, timestamp, value, deadline):
+        if self._filter is not None:
+            value = self._filter.update(value)
+
+        if self._sample_rate is not None:
+            # Read at the watch rate if that's faster, so only buffer when a sample is due,
+            # to the nearest reading so equal or whole multiple rates don't lose any
+            if self._sample_due is None:
+                self._sample_due = deadline
+            if deadline + 0.5 / self._read_rate >= self._sample_due:
+                self.buffer.append(timestamp, value)
+                # Skip samples we've missed rather than bunching up
+                self._sample_due = max(self._sample_due + 1.0 / self._sample_rate, deadline)
+
+        if self._watch_rate is not None:
+            last_value, self.last_value = self.last_value, value
+            if last_value is not None and abs(value-last_value) > self._sensitivity:
+                if callable(self._handler):
+                    # Every input shares the scheduler thread, one bad handler mustn't stop them all
+                    try:
+                        self._handler(self, value)
+                    except Exception:
+                        traceback.print_exc()
+
+    def latest(self):
+        """Returns the newest (timestamp, value) from the sampling buffer
+
+        @param self Object pointer."""
+        if self.buffer is None:
+            return None
+        return self.buffer.latest()
+
+    def window(self, n=None):
+        """Returns the newest n timestamps and values from the sampling buffer, oldest first
+
+        @param self Object pointer.
+        @param n Number of samples, defaults to the whole buffer"""
+        if self.buffer is None:
+            raise RuntimeError("Call start_sampling() first")
+        return self.buffer.window(n)
+
+
+class AnalogCollection(ObjectCollection):
+    """Collection of AnalogInputs which can be read in a single batch"""
+
+    def scan(self, channels=None):
+        """Reads several analog inputs back to back
+
+        @param self Object pointer.
+        @param channels List of input names, or indexes, to read. Defaults to all of them
+        @return Tuple of an array of voltages and an array of timestamps, in channel order"""
+        if not setup_analog():
+            raise RuntimeError("Analog is unavailable, check your pHAT/HAT and/or connections!")
+
+        if channels is None:
+            channels = self._index
+
+        inputs = [self[channel] for channel in channels]
+        return ads1015.scan([ads1015.conversion(i.channel, i._gain, i._sps) for i in inputs])
 
 
 class CapTouchSettings(object):
@@ -807,23 +1582,26 @@ def stop():
     return True
 
 
+animator = Animator(PULSE_FPS)
+blinker = Blinker()
+
 settings = ObjectCollection()
 settings._add(touch=CapTouchSettings())
 
-light = ObjectCollection()
+light = OutputCollection()
 light._add(blue=Light(LED1))
 light._add(yellow=Light(LED2))
 light._add(red=Light(LED3))
 light._add(green=Light(LED4))
 light._alias(amber='yellow')
 
-output = ObjectCollection()
+output = OutputCollection()
 output._add(one=Output(OUT1))
 output._add(two=Output(OUT2))
 output._add(three=Output(OUT3))
 output._add(four=Output(OUT4))
 
-input = ObjectCollection()
+input = InputCollection()
 input._add(one=Input(IN1))
 input._add(two=Input(IN2))
 input._add(three=Input(IN3))
@@ -843,7 +1621,23 @@ motor = ObjectCollection()
 motor._add(one=Motor(M1F, M1B))
 motor._add(two=Motor(M2F, M2B))
 
-analog = ObjectCollection()
+analog_scheduler = AnalogScheduler()
+
+
+def get_analog_scheduler():
+    """Returns the analog scheduler, replacing it if its thread has died
+
+    A replacement keeps the old one's subscribers, so every input carries on sampling."""
+    global analog_scheduler
+
+    with _analog_scheduler_lock:
+        if analog_scheduler.ident is not None and not analog_scheduler.alive():
+            subscribers = analog_scheduler.subscribers
+            analog_scheduler = AnalogScheduler()
+            analog_scheduler.subscribers = subscribers
+        return analog_scheduler
+
+analog = AnalogCollection()
 analog._add(one=AnalogInput(3))
 analog._add(two=AnalogInput(2))
 analog._add(three=AnalogInput(1))
@@ -1,30 +1,34 @@
+import threading
 import time
-from sys import exit, version_info
+from array import array
+from collections import namedtuple
 
 try:
-    from smbus import SMBus
+    from types import MappingProxyType
 except ImportError:
-    if version_info[0] < 3:
-        exit("This library requires python-smbus\nInstall with: sudo apt-get install python-smbus")
-    elif version_info[0] == 3:
-        exit("This library requires python3-smbus\nInstall with: sudo apt-get install python3-smbus")
+    # Python 2 has no read-only dict view
+    MappingProxyType = dict
 
-
-adc_available = True
+from .bus import get_bus, i2c_bus_id
 
 
-def i2c_bus_id():
-    revision = ([l[12:-1] for l in open('/proc/cpuinfo', 'r').readlines() if l[:8] == "Revision"] + ['0000'])[0]
-    return 1 if int(revision, 16) >= 4 else 0
+adc_available = True
 
 
 address = 0x48
-i2c = SMBus(i2c_bus_id())
+i2c = get_bus(i2c_bus_id())
+
+# Held for the whole of a conversion, so another thread can't change the config part way through
+# The bus itself is only locked per transaction, so touch isn't held up while we wait
+lock = threading.RLock()
 
 REG_CONV = 0x00
 REG_CFG = 0x01
+REG_LO_THRESH = 0x02
+REG_HI_THRESH = 0x03
 
 samples_per_second_map = {128: 0x0000, 250: 0x0020, 490: 0x0040, 920: 0x0060, 1600: 0x0080, 2400: 0x00A0, 3300: 0x00C0}
+ads1115_samples_per_second_map = {8: 0x0000, 16: 0x0020, 32: 0x0040, 64: 0x0060, 128: 0x0080, 250: 0x00A0, 475: 0x00C0, 860: 0x00E0}
 channel_map = {0: 0x4000, 1: 0x5000, 2: 0x6000, 3: 0x7000}
 programmable_gain_map = {6144: 0x0000, 4096: 0x0200, 2048: 0x0400, 1024: 0x0600, 512: 0x0800, 256: 0x0A00}
 
@@ -35,6 +39,52 @@ PGA_1_024V = 1024
 PGA_0_512V = 512
 PGA_0_256V = 256
 
+MODE_SINGLE = 0x0100
+OS_START = 0x8000
+
+COMP_QUE_DISABLE = 0x0003
+COMP_QUE_ONE = 0x0000
+
+# The data rate can be up to 10% slow, plus a little time to wake from power-down
+CONVERSION_MARGIN = 1.1
+WAKEUP_TIME = 0.00005
+
+# Set by set_ready_pin() when ALERT/RDY is wired to a GPIO
+_wait_for_ready = None
+
+
+class ChipProfile(object):
+    """Describes the resolution and data rates of an ADS1x15 variant"""
+    def __init__(self, name, bits, samples_per_second_map):
+        self.name = name
+        self.bits = bits
+        self.samples_per_second_map = samples_per_second_map
+
+        # Results are left-justified in the 16-bit conversion register
+        self.shift = 16 - bits
+        self.full_scale = float((1 << (bits - 1)) - 1)
+
+    def __repr__(self):
+        return self.name
+
+    def decode(self, data):
+        """Return the signed conversion result from two register bytes"""
+        value = (data[0] << 8) | data[1]
+
+        if value & 0x8000:  # Check and apply sign bit
+            value -= 1 << 16
+
+        return value >> self.shift
+
+
+ADS1015 = ChipProfile('ADS1015', 12, samples_per_second_map)
+ADS1115 = ChipProfile('ADS1115', 16, ads1115_samples_per_second_map)
+
+chips = {'ADS1015': ADS1015, 'ADS1115': ADS1115}
+
+# Set by setup(), assume the original part until then
+chip = ADS1015
+
 
 def busy():
     data = i2c.read_i2c_block_data(address, REG_CFG)
@@ -42,65 +92,260 @@ def busy():
     return (status & (1 << 15)) == 0
 
 
-def read_se_adc(channel=1):
-    programmable_gain = PGA_6_144V
-    samples_per_second = 250
-
-    # sane defaults
-    config = 0x0003 | 0x0100
+def _build_config(channel, programmable_gain, samples_per_second):
+    # sane defaults, comparator disabled unless it's driving ALERT/RDY
+    config = COMP_QUE_DISABLE if _wait_for_ready is None else COMP_QUE_ONE
 
-    config |= samples_per_second_map[samples_per_second]
+    config |= chip.samples_per_second_map[samples_per_second]
     config |= channel_map[channel]
     config |= programmable_gain_map[programmable_gain]
 
-    # set "single shot" mode
-    config |= 0x8000
+    return config
+
+
+Conversion = namedtuple('Conversion', ['single_shot', 'continuous', 'scale', 'duration'])
+Conversion.__doc__ = """Precomputed config bytes, volts-per-count scale and worst-case conversion time for one channel/gain/rate"""
+
+
+def _scale(programmable_gain):
+    # Multiply by gain, divide by full scale range and scale from mV to V
+    return programmable_gain / chip.full_scale / 1000.0
+
+
+def _build_table():
+    """Precompute every config word and scale factor for the detected chip"""
+    table = {}
+    for channel in channel_map:
+        for programmable_gain in programmable_gain_map:
+            scale = _scale(programmable_gain)
+            for samples_per_second in chip.samples_per_second_map:
+                config = _build_config(channel, programmable_gain, samples_per_second)
+                single_shot = config | MODE_SINGLE | OS_START
+                table[(channel, programmable_gain, samples_per_second)] = Conversion(
+                    ((single_shot >> 8) & 0xFF, single_shot & 0xFF),
+                    ((config >> 8) & 0xFF, config & 0xFF),
+                    scale,
+                    CONVERSION_MARGIN / samples_per_second + WAKEUP_TIME)
+    return MappingProxyType(table)
+
+
+config_table = _build_table()
+
+
+def conversion(channel=1, programmable_gain=PGA_6_144V, samples_per_second=250):
+    """Look up the precomputed Conversion for a channel, gain and rate
+
+    Raises a ValueError if the combination isn't supported by the detected chip."""
+    try:
+        return config_table[(channel, programmable_gain, samples_per_second)]
+    except KeyError:
+        if channel not in channel_map:
+            raise ValueError("Channel must be one of: {}".format(', '.join(str(x) for x in sorted(channel_map))))
+        if programmable_gain not in programmable_gain_map:
+            raise ValueError("Gain must be one of: {}".format(', '.join(str(x) for x in sorted(programmable_gain_map))))
+        raise ValueError("{} supports samples per second of: {}".format(
+            chip.name, ', '.join(str(x) for x in sorted(chip.samples_per_second_map))))
+
+
+def scale_factor(programmable_gain=PGA_6_144V):
+    """Return the volts per count for a gain, for converting read_raw() results in bulk"""
+    if programmable_gain not in programmable_gain_map:
+        raise ValueError("Gain must be one of: {}".format(', '.join(str(x) for x in sorted(programmable_gain_map))))
+    return _scale(programmable_gain)
+
+
+def detect_chip(attempts=3):
+    """Work out whether we're talking to an ADS1015 or an ADS1115
+
+    Times a single-shot conversion with the data rate bits set to 0x0020.
+    The ADS1015 will run this at 250SPS, the ADS1115 at 16!!! SPS.
+    Since the difference is ~an order of magnitude~ they're easy to tell apart.
+    Genius out of the box thinking by Niko
+
+    The fastest of several attempts is used, so a single late wakeup
+    under load can't make an ADS1015 look like an ADS1115."""
+    config = COMP_QUE_DISABLE | 0x0020 | channel_map[1] | programmable_gain_map[PGA_6_144V] | MODE_SINGLE | OS_START
+
+    t_fastest = None
 
-    # write single conversion flag
+    for _ in range(attempts):
+        i2c.write_i2c_block_data(address, REG_CFG, [(config >> 8) & 0xFF, config & 0xFF])
+
+        t_start = time.time()
+
+        while busy():
+            # We've got a lock on the I2S bus, but probably don't want to hog it!
+            time.sleep(1.0 / 160)
+
+        t_elapsed = time.time() - t_start
+
+        if t_fastest is None or t_elapsed < t_fastest:
+            t_fastest = t_elapsed
+
+    # Split the difference between 1/250th and 1/16th of a second
+    if t_fastest < 1.0 / 32:
+        return ADS1015
+
+    return ADS1115
+
+
+def setup(force_chip=None):
+    """Check the ADC is present and work out which variant it is
+
+    @param force_chip Skip detection and assume "ADS1015" or "ADS1115", for testing against a fake bus"""
+    global adc_available, chip, config_table
+
+    if force_chip is not None and str(force_chip).upper() not in chips:
+        raise ValueError("Chip must be one of: {}".format(', '.join(sorted(chips))))
+
+    with lock:
+        try:
+            if force_chip is not None:
+                chip = chips[str(force_chip).upper()]
+                busy()
+            else:
+                chip = detect_chip()
+            adc_available = True
+        except IOError:
+            adc_available = False
+
+        config_table = _build_table()
+
+    return adc_available
+
+
+def start_continuous(channel=1, programmable_gain=PGA_6_144V, samples_per_second=250):
+    """Put the ADC into continuous conversion mode on a single channel
+
+    The config is written once, after which every conversion result
+    can be fetched with a single read of the conversion register.
+    Hold "lock" until stop_continuous() to keep other threads off the ADC."""
+    i2c.write_i2c_block_data(address, REG_CFG, list(conversion(channel, programmable_gain, samples_per_second).continuous))
+
+
+def stop_continuous():
+    """Return the ADC to single-shot, power-down mode"""
+    config = _build_config(0, PGA_6_144V, 250) | MODE_SINGLE
     i2c.write_i2c_block_data(address, REG_CFG, [(config >> 8) & 0xFF, config & 0xFF])
 
-    # Time the ADC conversion to disambiguate ADS1015 from ADS1115
-    # Genius out of the box thinking by Niko
-    # the ADS1015 will run this at 250SPS
-    # the ADS1115 will run this at 16!!! SPS
-    # Since the difference is ~an order of magnitude~ they're easy to tell apart.
-    t_start = time.time()
 
-    while busy():
-        # We've got a lock on the I2S bus, but probably don't want to hog it!
-        time.sleep(1.0 / 160)
+def read_continuous(programmable_gain=PGA_6_144V):
+    """Read the latest result from a running continuous conversion"""
+    data = i2c.read_i2c_block_data(address, REG_CONV, 2)
+    return max(0, chip.decode(data) * scale_factor(programmable_gain))
 
-    t_end = time.time()
-    t_elapsed = t_end - t_start
 
-    data = i2c.read_i2c_block_data(address, REG_CONV)
+def stream_se_adc(channel=1, programmable_gain=PGA_6_144V, samples_per_second=250, count=None):
+    """Yield samples from channel at the configured samples per second
 
-    if t_elapsed < 1.0 / 16: # 1/16th second is ADS1115 speed, if it's faster it must be an ADS1015
-        # 12-bit
-        value = (data[0] << 4) | (data[1] >> 4)
+    Uses continuous conversion mode, so each sample costs one register read.
+    Stops after "count" samples if given, otherwise runs until closed.
+    Other threads wanting the ADC will wait until the stream is finished or closed."""
+    entry = conversion(channel, programmable_gain, samples_per_second)
+    period = 1.0 / samples_per_second
+    decode = chip.decode
 
-        if value & 0x800:  # Check and apply sign bit
-            value -= 1 << 12
+    with lock:
+        i2c.write_i2c_block_data(address, REG_CFG, list(entry.continuous))
 
-        value /= 2047.0  # Divide by full scale range
+        try:
+            # Let the first conversion complete before reading it, allowing for a slow
+            # clock and wake-up, or we'd read the last conversion, maybe from another channel
+            deadline = time.time() + entry.duration
+            taken = 0
+            while count is None or taken < count:
+                now = time.time()
+                if deadline > now:
+                    time.sleep(deadline - now)
+                else:
+                    # Running behind, skip conversions we've missed rather than bunching up
+                    deadline = now
+                yield max(0, decode(i2c.read_i2c_block_data(address, REG_CONV, 2)) * entry.scale)
+                deadline += period
+                taken += 1
+        finally:
+            stop_continuous()
 
-    else: # If it's slower than "ideal" ADS1115 then it's an ADS1115
-        # 16-bit
-        value = (data[0] << 8) | data[1]
 
-        if value & 0x8000:  # Check and apply sign bit
-            value -= 1 << 16
+def set_ready_pin(wait_for_ready):
+    """Use the ALERT/RDY pin to tell when a conversion has finished
 
-        value /= 32767.0  # Divide by full scale rane
+    Explorer HAT doesn't connect ALERT/RDY, but if you've wired it to a GPIO
+    pass a function which takes a timeout in seconds, waits for the pin to
+    go low and returns True, or False if it timed out. Pass None to go back
+    to sleeping for the known conversion time.
 
-    value *= float(programmable_gain)  # Multiply by gain
-    value /= 1000.0  # Scale from mV to V
-    value = max(0, value)  # Sweep negative voltages under the rug
+    Either way a conversion costs one config write and one result read."""
+    global _wait_for_ready, config_table
 
-    return value
+    with lock:
+        _wait_for_ready = wait_for_ready
 
+        if wait_for_ready is not None:
+            # A high threshold MSB of 1 and low threshold MSB of 0 turns ALERT/RDY into a conversion ready signal
+            i2c.write_i2c_block_data(address, REG_HI_THRESH, [0x80, 0x00])
+            i2c.write_i2c_block_data(address, REG_LO_THRESH, [0x00, 0x00])
 
-try:
-    read_se_adc()
-except IOError:
-    adc_available = False
+        config_table = _build_table()
+
+
+def _wait(entry):
+    if _wait_for_ready is not None and _wait_for_ready(entry.duration):
+        return
+
+    # Sleep for the longest the conversion could take, rather than polling busy()
+    time.sleep(entry.duration)
+
+
+def _convert(entry):
+    with lock:
+        # write single conversion flag
+        i2c.write_i2c_block_data(address, REG_CFG, list(entry.single_shot))
+
+        _wait(entry)
+
+        return chip.decode(i2c.read_i2c_block_data(address, REG_CONV, 2))
+
+
+def read_raw(channel=1, programmable_gain=PGA_6_144V, samples_per_second=250):
+    """Take a single-shot reading and return the signed conversion result
+
+    Skips the float maths for high-rate callers, multiply
+    by scale_factor(programmable_gain) to get volts."""
+    return _convert(conversion(channel, programmable_gain, samples_per_second))
+
+
+def read_se_adc(channel=1, programmable_gain=PGA_6_144V, samples_per_second=250):
+    entry = conversion(channel, programmable_gain, samples_per_second)
+
+    # Sweep negative voltages under the rug
+    return max(0, _convert(entry) * entry.scale)
+
+
+def scan(conversions):
+    """Run a list of Conversions back to back and return the results
+
+    Each config is written as soon as the previous result has been read,
+    with no lookups or allocations in between.
+    Returns an array('f') of voltages and an array('d') of the
+    time.time() each result was read, in the same order as conversions."""
+    count = len(conversions)
+    values = array('f', [0.0]) * count
+    timestamps = array('d', [0.0]) * count
+    decode = chip.decode
+    write = i2c.write_i2c_block_data
+    read = i2c.read_i2c_block_data
+
+    configs = [list(entry.single_shot) for entry in conversions]
+    scales = [entry.scale for entry in conversions]
+
+    with lock:
+        for index in range(count):
+            write(address, REG_CFG, configs[index])
+            _wait(conversions[index])
+            data = read(address, REG_CONV, 2)
+            timestamps[index] = time.time()
+            # Sweep negative voltages under the rug
+            values[index] = max(0, decode(data) * scales[index])
+
+    return values, timestamps
@@ -0,0 +1,533 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+import traceback
+
+try:
+    from time import monotonic
+except ImportError:
+    # Python 2 doesn't have a monotonic clock, make do with wall-clock time
+    from time import time as monotonic
+
+from .pins import StoppableThread
+
+
+class FrameStats(object):
+    """Timing of the frames drawn for one animation
+
+    Jitter is how late each frame was drawn after its deadline,
+    dropped frames are those skipped because the animator fell behind.
+    For a blink each frame is an edge, and total jitter is the
+    cumulative phase error."""
+    def __init__(self):
+        self.frames = 0
+        self.dropped = 0
+        self.total_jitter = 0.0
+        self.max_jitter = 0.0
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+    def frame(self, jitter):
+        self.frames += 1
+        self.total_jitter += jitter
+        if jitter > self.max_jitter:
+            self.max_jitter = jitter
+
+    def as_dict(self):
+        return {
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'mean_jitter': self.total_jitter / self.frames if self.frames else 0.0,
+            'total_jitter': self.total_jitter,
+            'max_jitter': self.max_jitter
+        }
+
+
+def _linear(x):
+    return x
+
+
+def _sine(x):
+    return 0.5 - 0.5 * math.cos(math.pi * x)
+
+
+def _ease_in_out(x):
+    if x < 0.5:
+        return 4 * x * x * x
+    return 1 - 4 * (1 - x) ** 3
+
+
+curves = {
+    'linear': _linear,
+    'sine': _sine,
+    'ease-in-out': _ease_in_out
+}
+
+
+def _curve(name):
+    try:
+        return curves[name]
+    except KeyError:
+        raise ValueError("Curve must be one of: {}".format(', '.join(sorted(curves))))
+
+
+_gamma_tables = {}
+
+
+def gamma_table(gamma):
+    """Returns a table of duty cycles for brightness 0 to 100 at gamma
+
+    Duty cycles are rounded to 0.1%, so the dim end isn't lost at
+    high gamma. Tables are built once and shared between outputs."""
+    if gamma <= 0:
+        raise ValueError("Gamma must be greater than 0")
+
+    if gamma not in _gamma_tables:
+        _gamma_tables[gamma] = tuple(round(100.0 * (brightness / 100.0) ** gamma, 1) for brightness in range(101))
+
+    return _gamma_tables[gamma]
+
+
+class Pulse(object):
+    """Delta-timed LED pulse
+
+    The whole cycle is compiled into a table of duty cycles, one per
+    frame, so drawing a frame is a single lookup. The frame is picked
+    from wall-clock time, so it never drifts however late it's drawn."""
+    def __init__(self, time_on, time_off, transition_on, transition_off, curve='linear'):
+        self.time_on = time_on
+        self.time_off = time_off
+        self.transition_on = transition_on
+        self.transition_off = transition_off
+        self.curve = curve
+        self.finished = False
+
+        self.fps = None
+        self.table = None
+        self._compiled = None
+
+        self.stats = FrameStats()
+        self.time_start = monotonic()
+
+    def start(self):
+        self.stats = FrameStats()
+        self.time_start = monotonic()
+
+    def compile(self, fps):
+        """Builds the table of duty cycles for one full cycle at fps, if anything has changed"""
+        key = (fps, self.time_on, self.time_off, self.transition_on, self.transition_off, self.curve)
+        if key == self._compiled:
+            return
+
+        curve = _curve(self.curve)
+        time_on = self.transition_on + self.time_on
+        time_off = time_on + self.transition_off
+        frames = max(1, int(round((time_off + self.time_off) * fps)))
+
+        table = []
+        for index in range(frames):
+            delta = float(index) / fps
+
+            if delta < self.transition_on:
+                # Transition On Phase
+                table.append(int(round(100.0 * curve(delta / self.transition_on))))
+
+            elif delta < time_on:
+                table.append(100)
+
+            elif delta < time_off:
+                # Transition Off Phase
+                table.append(int(round(100.0 * curve(1.0 - (delta - time_on) / self.transition_off))))
+
+            else:
+                table.append(0)
+
+        self.fps = fps
+        self.table = tuple(table)
+        self._compiled = key
+
+    def frame(self, now):
+        return self.table[int((now - self.time_start) * self.fps) % len(self.table)]
+
+
+class Fade(object):
+    """Fade from one brightness to another over a duration in seconds
+
+    Compiled into a table of duty cycles, one per frame."""
+    def __init__(self, start, end, duration, curve='linear'):
+        self.start = start
+        self.end = end
+        self.duration = duration
+        self.curve = curve
+        self.finished = False
+
+        self.fps = None
+        self.table = None
+
+        self.stats = FrameStats()
+        self.time_start = monotonic()
+
+    def compile(self, fps):
+        curve = _curve(self.curve)
+        frames = int(self.duration * fps)
+
+        self.fps = fps
+        self.table = tuple(int(round(self.start + (self.end - self.start) * curve(float(index) / (self.duration * fps))))
+                           for index in range(frames)) + (int(round(self.end)),)
+
+    def frame(self, now):
+        index = int((now - self.time_start) * self.fps)
+
+        if index >= len(self.table) - 1:
+            self.finished = True
+            return self.table[-1]
+
+        return self.table[index]
+
+
+class Sequence(object):
+    """Timestamped keyframes for an output, compiled once into a table of duty cycles
+
+    @param keyframes List of ( time in seconds, brightness % ) pairs
+    @param loop Start again from time 0 after the last keyframe
+    @param curve How to get from one keyframe to the next, 'step' to jump
+                 straight there or one of 'linear', 'sine' or 'ease-in-out'
+
+    The same Sequence can be played on any number of outputs."""
+    def __init__(self, keyframes, loop=False, curve='linear'):
+        # By time only, and stable, so keyframes at the same time keep their order for a jump
+        keyframes = sorted(((float(t), d) for t, d in keyframes), key=lambda keyframe: keyframe[0])
+
+        if not keyframes:
+            raise ValueError("A sequence needs at least one keyframe")
+
+        for t, d in keyframes:
+            if t < 0:
+                raise ValueError("Keyframe times must not be negative")
+            if not 0 <= d <= 100:
+                raise ValueError("Keyframe brightness must be between 0 and 100")
+
+        if curve != 'step':
+            _curve(curve)
+
+        self.keyframes = tuple(keyframes)
+        self.loop = loop
+        self.curve = curve
+        self.duration = keyframes[-1][0]
+
+        self.fps = None
+        self.table = None
+
+    def compile(self, fps):
+        """Builds the table of duty cycles at fps, only once per fps"""
+        if fps == self.fps:
+            return
+
+        curve = None if self.curve == 'step' else _curve(self.curve)
+        keyframes = self.keyframes
+        frames = max(1, int(self.duration * fps) + (0 if self.loop else 1))
+
+        table = []
+        current = 0
+        for index in range(frames):
+            t = float(index) / fps
+
+            while current + 1 < len(keyframes) and keyframes[current + 1][0] <= t:
+                current += 1
+
+            t_from, d_from = keyframes[current]
+
+            if t < t_from or current + 1 == len(keyframes) or curve is None:
+                # Before the first keyframe, after the last, or stepping
+                duty_cycle = d_from if t >= t_from else keyframes[0][1]
+            else:
+                t_to, d_to = keyframes[current + 1]
+                duty_cycle = d_from + (d_to - d_from) * curve((t - t_from) / (t_to - t_from))
+
+            table.append(int(round(duty_cycle)))
+
+        self.fps = fps
+        self.table = tuple(table)
+
+
+class Playback(object):
+    """One output's run through a Sequence"""
+    def __init__(self, sequence):
+        self.sequence = sequence
+        self.finished = False
+
+        self.fps = None
+        self.table = None
+
+        self.stats = FrameStats()
+        self.time_start = monotonic()
+
+    def compile(self, fps):
+        self.sequence.compile(fps)
+        self.fps = fps
+        self.table = self.sequence.table
+
+    def frame(self, now):
+        index = int((now - self.time_start) * self.fps)
+
+        if self.sequence.loop:
+            return self.table[index % len(self.table)]
+
+        if index < 0:
+            # Held back by a phase offset
+            return self.table[0]
+
+        if index >= len(self.table) - 1:
+            self.finished = True
+            return self.table[-1]
+
+        return self.table[index]
+
+
+class Animator(StoppableThread):
+    """Single thread which draws every running pulse and fade
+
+    Each frame asks every animation for its brightness and only
+    writes the outputs whose brightness has changed. Blocks
+    entirely when nothing is animating."""
+    def __init__(self, fps):
+        StoppableThread.__init__(self)
+        self.fps = fps
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        # Output: animation
+        self.animations = {}
+        # Output: last duty cycle written
+        self.written = {}
+
+    def add(self, output, animation):
+        animation.compile(self.fps)
+
+        with self.lock:
+            self.animations[output] = animation
+            self.written.pop(output, None)
+        self.wake.set()
+        self.start()
+
+    def remove(self, output):
+        with self.lock:
+            self.written.pop(output, None)
+            return self.animations.pop(output, None)
+
+    def get(self, output):
+        return self.animations.get(output)
+
+    def synchronise(self, offsets):
+        """Locks running animations to one timebase
+
+        @param offsets Dict of output: seconds to delay that output's animation by"""
+        with self.lock:
+            time_start = monotonic()
+            for output in offsets:
+                animation = self.animations.get(output)
+                if animation is not None:
+                    animation.time_start = time_start + offsets[output]
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake.set()
+        StoppableThread.stop(self)
+
+    def run(self):
+        period = 1.0 / self.fps
+        deadline = None
+
+        while not self.stop_event.is_set():
+            with self.lock:
+                animations = list(self.animations.items())
+
+            if not animations:
+                self.wake.wait()
+                self.wake.clear()
+                deadline = None
+                continue
+
+            now = monotonic()
+
+            if deadline is None:
+                deadline = now
+
+            jitter = now - deadline
+
+            frame = [(output, animation, animation.frame(now)) for output, animation in animations]
+
+            # Write the whole frame in one go, holding the lock so a stop() can't be overwritten by a stale frame
+            with self.lock:
+                for output, animation, duty_cycle in frame:
+                    animation.stats.frame(jitter)
+
+                    # Skip anything stopped or replaced since we took our copy
+                    if self.animations.get(output) is not animation:
+                        continue
+
+                    if animation.finished:
+                        del self.animations[output]
+                        self.written.pop(output, None)
+                    elif self.written.get(output) == duty_cycle:
+                        continue
+                    else:
+                        self.written[output] = duty_cycle
+
+                    try:
+                        output._show(duty_cycle)
+                    except Exception:
+                        # Every output shares this thread, so drop just the one that failed
+                        traceback.print_exc()
+                        self.animations.pop(output, None)
+                        self.written.pop(output, None)
+
+            deadline += period
+            now = monotonic()
+
+            if now > deadline:
+                # Running behind, drop the frames we've missed rather than drawing them late
+                dropped = int((now - deadline) / period) + 1
+                deadline += dropped * period
+                for output, animation in animations:
+                    animation.stats.dropped += dropped
+
+            time.sleep(deadline - now)
+
+
+class Blink(object):
+    """Square wave, on for "on" seconds then off for "off" seconds
+
+    Edges are scheduled from the time the blink started, so a late
+    edge never pushes the ones after it back."""
+    def __init__(self, on, off):
+        if on <= 0 or off <= 0:
+            raise ValueError("On and off times must be greater than 0")
+
+        self.on = float(on)
+        self.off = float(off)
+        self.period = self.on + self.off
+        self.finished = False
+
+        # Index of the next edge, even edges turn on and odd edges turn off
+        self.edge = 0
+        # Sequence number of this blink's entry in the Blinker's queue
+        self.seq = None
+
+        self.stats = FrameStats()
+        self.time_start = monotonic()
+
+    def deadline(self, edge):
+        return self.time_start + (edge // 2) * self.period + (self.on if edge % 2 else 0)
+
+    def edge_at(self, now):
+        """Returns the index of the last edge due at or before now"""
+        cycles = int((now - self.time_start) // self.period)
+        return cycles * 2 + (1 if now - self.time_start - cycles * self.period >= self.on else 0)
+
+
+class Blinker(StoppableThread):
+    """Single thread which toggles every blinking output
+
+    Keeps one queue of upcoming edges for all outputs, whatever their
+    periods, and sleeps until the next one is due. Blocks entirely
+    when nothing is blinking."""
+    def __init__(self):
+        StoppableThread.__init__(self)
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        # Output: blink
+        self.blinks = {}
+        # ( deadline, seq, output, blink ), stale entries are skipped when they come up
+        self.queue = []
+        self.counter = itertools.count()
+
+    def _schedule(self, output, blink):
+        blink.seq = next(self.counter)
+        heapq.heappush(self.queue, (blink.deadline(blink.edge), blink.seq, output, blink))
+
+    def add(self, output, blink):
+        with self.lock:
+            blink.time_start = monotonic()
+            blink.edge = 0
+            self.blinks[output] = blink
+            self._schedule(output, blink)
+        self.wake.set()
+        self.start()
+
+    def remove(self, output):
+        with self.lock:
+            return self.blinks.pop(output, None)
+
+    def get(self, output):
+        return self.blinks.get(output)
+
+    def synchronise(self, offsets):
+        """Locks running blinks to one timebase
+
+        @param offsets Dict of output: seconds to delay that output's blink by"""
+        with self.lock:
+            time_start = monotonic()
+            for output in offsets:
+                blink = self.blinks.get(output)
+                if blink is not None:
+                    blink.time_start = time_start + offsets[output]
+                    blink.edge = 0
+                    if offsets[output] > 0:
+                        output.duty_cycle(0)
+                    self._schedule(output, blink)
+        self.wake.set()
+
+    def stop(self):
+        self.stop_event.set()
+        self.wake.set()
+        StoppableThread.stop(self)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            with self.lock:
+                while self.queue:
+                    deadline, seq, output, blink = self.queue[0]
+                    if self.blinks.get(output) is blink and blink.seq == seq:
+                        break
+                    heapq.heappop(self.queue)
+                else:
+                    deadline = None
+
+            if deadline is None:
+                self.wake.wait()
+                self.wake.clear()
+                continue
+
+            now = monotonic()
+
+            if now < deadline:
+                # An add() or synchronise() might bring the next edge forward, so wake for those too
+                self.wake.wait(deadline - now)
+                self.wake.clear()
+                continue
+
+            # Toggle under the lock, so a stop() can't be overwritten by a stale edge
+            with self.lock:
+                deadline, seq, output, blink = heapq.heappop(self.queue)
+                if self.blinks.get(output) is not blink or blink.seq != seq:
+                    continue
+
+                # If we've fallen more than an edge behind, skip straight to the right state
+                edge = max(blink.edge, blink.edge_at(now))
+                blink.stats.dropped += edge - blink.edge
+
+                # Not parked when off, restarting PWM every cycle costs more than leaving it idle
+                try:
+                    output.duty_cycle(0 if edge % 2 else 100)
+                except Exception:
+                    # Every output shares this thread, so drop just the one that failed
+                    traceback.print_exc()
+                    del self.blinks[output]
+                    continue
+                blink.stats.frame(monotonic() - blink.deadline(edge))
+
+                blink.edge = edge + 1
+                self._schedule(output, blink)
@@ -0,0 +1,84 @@
+import threading
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class RingBuffer(object):
+    """Fixed-size history of timestamped samples
+
+    Storage is allocated once, as numpy arrays if numpy is
+    installed or as array('d') if not. Once full, new samples
+    overwrite the oldest."""
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError("Size must be at least 1")
+
+        self.size = size
+        self.lock = threading.Lock()
+
+        if numpy is not None:
+            self.timestamps = numpy.zeros(size, dtype=numpy.float64)
+            self.values = numpy.zeros(size, dtype=numpy.float64)
+        else:
+            self.timestamps = array('d', [0.0]) * size
+            self.values = array('d', [0.0]) * size
+
+        # Total number of samples ever appended, the next write goes to written % size
+        self.written = 0
+
+    def __len__(self):
+        return min(self.written, self.size)
+
+    def append(self, timestamp, value):
+        with self.lock:
+            index = self.written % self.size
+            self.timestamps[index] = timestamp
+            self.values[index] = value
+            self.written += 1
+
+    def clear(self):
+        with self.lock:
+            self.written = 0
+
+    def latest(self):
+        """Returns the newest (timestamp, value), or None if nothing has been sampled yet"""
+        with self.lock:
+            if self.written == 0:
+                return None
+            index = (self.written - 1) % self.size
+            return self.timestamps[index], self.values[index]
+
+    def window(self, n=None):
+        """Returns copies of the newest n timestamps and values, oldest first
+
+        @param n Number of samples, defaults to everything in the buffer"""
+        with self.lock:
+            count = len(self)
+            if n is None or n > count:
+                n = count
+
+            start = (self.written - n) % self.size
+            end = start + n
+
+            if end <= self.size:
+                if numpy is not None:
+                    # numpy slices are views, which the sampler would write over
+                    return self.timestamps[start:end].copy(), self.values[start:end].copy()
+                return self.timestamps[start:end], self.values[start:end]
+
+            end -= self.size
+            if numpy is not None:
+                return (numpy.concatenate((self.timestamps[start:], self.timestamps[:end])),
+                        numpy.concatenate((self.values[start:], self.values[:end])))
+            return self.timestamps[start:] + self.timestamps[:end], self.values[start:] + self.values[:end]
+
+    def memoryview(self):
+        """Returns memoryviews of the raw timestamp and value storage, without copying
+
+        Samples are in write order starting from index "written % size",
+        so the oldest sample is there once the buffer has wrapped."""
+        return memoryview(self.timestamps), memoryview(self.values)
@@ -0,0 +1,139 @@
+import threading
+import time
+from sys import version_info
+
+try:
+    from smbus import SMBus
+except ImportError:
+    if version_info[0] < 3:
+        raise ImportError("This library requires python-smbus\nInstall with: sudo apt-get install python-smbus")
+    elif version_info[0] == 3:
+        raise ImportError("This library requires python3-smbus\nInstall with: sudo apt-get install python3-smbus")
+
+
+def i2c_bus_id():
+    revision = ([l[12:-1] for l in open('/proc/cpuinfo', 'r').readlines() if l[:8] == "Revision"] + ['0000'])[0]
+    return 1 if int(revision, 16) >= 4 else 0
+
+
+class LockedSMBus(object):
+    """SMBus wrapper which lets one thread at a time use the bus
+
+    Every transaction takes the lock, so a write/read pair from one
+    thread can't be interleaved with another's. Use "with bus:" to
+    hold the lock across several transactions.
+
+    Keeps count of how often threads had to wait, and for how long."""
+    def __init__(self, bus_id):
+        self.bus_id = bus_id
+        self.bus = SMBus(bus_id)
+        self.lock = threading.RLock()
+
+        self.acquisitions = 0
+        self.contentions = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def acquire(self):
+        if not self.lock.acquire(False):
+            t_start = time.time()
+            self.lock.acquire()
+            t_waited = time.time() - t_start
+
+            self.contentions += 1
+            self.wait_time += t_waited
+            self.max_wait_time = max(self.max_wait_time, t_waited)
+
+        self.acquisitions += 1
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.release()
+
+    def stats(self):
+        """Returns a dict of lock acquisitions, how many had to wait and the time spent waiting"""
+        return {
+            'acquisitions': self.acquisitions,
+            'contentions': self.contentions,
+            'wait_time': self.wait_time,
+            'max_wait_time': self.max_wait_time
+        }
+
+    def reset_stats(self):
+        self.acquisitions = 0
+        self.contentions = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def read_byte(self, addr):
+        with self:
+            return self.bus.read_byte(addr)
+
+    def write_byte(self, addr, value):
+        with self:
+            return self.bus.write_byte(addr, value)
+
+    def read_byte_data(self, addr, cmd):
+        with self:
+            return self.bus.read_byte_data(addr, cmd)
+
+    def write_byte_data(self, addr, cmd, value):
+        with self:
+            return self.bus.write_byte_data(addr, cmd, value)
+
+    def read_word_data(self, addr, cmd):
+        with self:
+            return self.bus.read_word_data(addr, cmd)
+
+    def write_word_data(self, addr, cmd, value):
+        with self:
+            return self.bus.write_word_data(addr, cmd, value)
+
+    def read_i2c_block_data(self, addr, cmd, length=32):
+        with self:
+            return self.bus.read_i2c_block_data(addr, cmd, length)
+
+    def write_i2c_block_data(self, addr, cmd, values):
+        with self:
+            return self.bus.write_i2c_block_data(addr, cmd, values)
+
+    def __getattr__(self, name):
+        # Anything we haven't wrapped above still gets the lock
+        function = getattr(self.bus, name)
+        if not callable(function):
+            return function
+
+        def locked(*args, **kwargs):
+            with self:
+                return function(*args, **kwargs)
+        locked.__name__ = name
+        return locked
+
+
+_buses = {}
+_buses_lock = threading.Lock()
+
+
+def get_bus(bus_id=None):
+    """Returns the shared, locked SMBus for bus_id, opening it if needed
+
+    @param bus_id I2C bus number, defaults to the one on the GPIO header"""
+    if bus_id is None:
+        bus_id = i2c_bus_id()
+
+    with _buses_lock:
+        if bus_id not in _buses:
+            _buses[bus_id] = LockedSMBus(bus_id)
+        return _buses[bus_id]
+
+
+def stats():
+    """Returns the lock stats for every open bus, keyed by bus number"""
+    with _buses_lock:
+        return dict((bus_id, _buses[bus_id].stats()) for bus_id in _buses)
@@ -0,0 +1,166 @@
+from bisect import bisect_left
+
+try:
+    import gpiod
+except ImportError:
+    gpiod = None
+
+from .buffer import RingBuffer
+from .events import monotonic
+from .pins import StoppableThread
+
+
+class PulseCounter(object):
+    """Counts pulses and keeps their timestamps to measure frequency
+
+    @param history Number of pulse timestamps kept for frequency()"""
+    def __init__(self, history=1024):
+        self.timestamps = RingBuffer(history)
+        self.pulses = 0
+        # Level the last edge left the input at
+        self.level = None
+
+    def pulse(self, timestamp):
+        # Only ever fed from one thread
+        self.pulses += 1
+        self.timestamps.append(timestamp, 1)
+
+    def edge(self, timestamp, level):
+        if level == self.level:
+            # Sampled after a short pulse had already ended, so it's the opposite of the last edge
+            level = 1 - level
+        self.level = level
+
+        if level == 1:
+            self.pulse(timestamp)
+
+    def count(self):
+        return self.pulses
+
+    def frequency(self, window=1.0):
+        """Returns the frequency in Hz of the pulses seen in the last "window" seconds
+
+        Measured from the time between the first and last pulse in the window,
+        rather than counting pulses, so it's precise even over short windows."""
+        timestamps, values = self.timestamps.window()
+        count = len(timestamps)
+        first = bisect_left(timestamps, monotonic() - window, 0, count) if count else 0
+
+        if count - first < 2:
+            return 0.0
+
+        return (count - first - 1) / (timestamps[count - 1] - timestamps[first])
+
+    def reset(self):
+        self.pulses = 0
+        self.timestamps.clear()
+
+
+class LineEvents(StoppableThread):
+    """Reads edges on one or more pins from kernel gpiochip line events
+
+    The kernel timestamps and buffers edges, so nothing runs in Python
+    per edge until a batch is read, and none are lost to a slow read.
+    Edges on every pin arrive in order, on this one thread.
+
+    @param pins List of BCM pin numbers
+    @param handler Called with ( pin, timestamp, level ) for every edge
+    @param edge 'rising' or 'both'
+    @param chip Path to the gpiochip the header pins are on"""
+    def __init__(self, pins, handler, edge='rising', chip='/dev/gpiochip0'):
+        if gpiod is None:
+            raise ImportError("Line events require the gpiod module\nInstall with: sudo apt-get install python3-libgpiod")
+
+        if edge not in ('rising', 'both'):
+            raise ValueError("Edge must be 'rising' or 'both'")
+
+        StoppableThread.__init__(self)
+        self.pins = list(pins)
+        self.handler = handler
+
+        if hasattr(gpiod, 'request_lines'):
+            # libgpiod 2, timestamps are from the monotonic clock unless asked otherwise
+            from gpiod.line import Direction, Edge
+            settings = gpiod.LineSettings(direction=Direction.INPUT,
+                                          edge_detection=Edge.RISING if edge == 'rising' else Edge.BOTH)
+            self.request = gpiod.request_lines(chip, consumer='explorerhat', config={tuple(self.pins): settings})
+            self.rising = gpiod.EdgeEvent.Type.RISING_EDGE
+            self.lines = None
+        else:
+            # libgpiod 1, timestamps are monotonic from Linux 5.7
+            self.request = None
+            self.lines = gpiod.Chip(chip).get_lines(self.pins)
+            self.lines.request(consumer='explorerhat', type=gpiod.LINE_REQ_EV_RISING_EDGE if edge == 'rising' else gpiod.LINE_REQ_EV_BOTH_EDGES)
+            self.rising = gpiod.LineEvent.RISING_EDGE
+
+    def run(self):
+        handler = self.handler
+        rising = self.rising
+
+        while not self.stop_event.is_set():
+            if self.request is not None:
+                if self.request.wait_edge_events(0.1):
+                    for event in self.request.read_edge_events():
+                        handler(event.line_offset, event.timestamp_ns / 1000000000.0,
+                                1 if event.event_type == rising else 0)
+                continue
+
+            lines = self.lines.event_wait(nsec=100000000)
+            if not lines:
+                continue
+
+            events = []
+            for line in lines:
+                events.extend(line.event_read_multiple())
+
+            # Lines are read one after another, so put their edges back in order
+            events.sort(key=lambda event: (event.sec, event.nsec))
+            for event in events:
+                handler(event.source.offset(), event.sec + event.nsec / 1000000000.0,
+                        1 if event.type == rising else 0)
+
+    def stop(self):
+        StoppableThread.stop(self)
+        if self.request is not None:
+            self.request.release()
+        else:
+            self.lines.release()
+
+
+class LineValues(object):
+    """Reads several pins at once with one gpiochip get_values call
+
+    Holds the lines while open, which stops RPi.GPIO detecting edges on
+    them, so release() before using them for anything else.
+
+    @param pins List of BCM pin numbers
+    @param chip Path to the gpiochip the header pins are on"""
+    def __init__(self, pins, chip='/dev/gpiochip0'):
+        if gpiod is None:
+            raise ImportError("Line values require the gpiod module\nInstall with: sudo apt-get install python3-libgpiod")
+
+        self.pins = list(pins)
+
+        if hasattr(gpiod, 'request_lines'):
+            from gpiod.line import Direction, Value
+            self.request = gpiod.request_lines(chip, consumer='explorerhat', config={
+                tuple(self.pins): gpiod.LineSettings(direction=Direction.INPUT)})
+            self.active = Value.ACTIVE
+            self.lines = None
+        else:
+            self.request = None
+            self.lines = gpiod.Chip(chip).get_lines(self.pins)
+            self.lines.request(consumer='explorerhat', type=gpiod.LINE_REQ_DIR_IN)
+
+    def get_values(self):
+        """Returns a list of levels, one per pin, all read at once"""
+        if self.request is not None:
+            active = self.active
+            return [1 if value == active else 0 for value in self.request.get_values(self.pins)]
+        return self.lines.get_values()
+
+    def release(self):
+        if self.request is not None:
+            self.request.release()
+        else:
+            self.lines.release()
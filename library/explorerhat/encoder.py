@@ -0,0 +1,98 @@
+from bisect import bisect_left
+
+from .buffer import RingBuffer
+from .events import monotonic
+
+
+# Position change for each ( previous state << 2 ) | state, where state is ( a << 1 ) | b
+# None means both inputs changed at once, so the direction is lost
+TRANSITIONS = (
+    0, 1, -1, None,
+    -1, 0, None, 1,
+    1, None, 0, -1,
+    None, -1, 1, 0
+)
+
+
+class Encoder(object):
+    """Rotary/quadrature encoder across two inputs
+
+    Both inputs' edges go through one state machine, a single table
+    lookup per edge, on one thread. Position counts every edge, so
+    four counts per full cycle of the encoder's outputs.
+
+    Uses the kernel's gpiochip line events through gpiod if it's
+    installed, which timestamps and orders edges across both inputs,
+    and feeds counting and on_changed/on_high/on_low on them too.
+    Otherwise edges come from RPi.GPIO's event thread, sharing its
+    edge detection with on_changed/on_high/on_low.
+
+    @param input_a Input wired to the encoder's A output, eg: explorerhat.input.one
+    @param input_b Input wired to the encoder's B output
+    @param history Number of steps kept for velocity()"""
+    def __init__(self, input_a, input_b, history=1024):
+        self.input_a = input_a
+        self.input_b = input_b
+        self.steps = RingBuffer(history)
+
+        # Python ints never overflow, so position can run forever in either direction
+        self.position = 0
+        # Edges the decoder couldn't follow, because both inputs changed at once
+        # or an edge went missing, usually from turning too fast
+        self.errors = 0
+
+        self.state = (input_a.read() << 1) | input_b.read()
+
+        # Both inputs on one line events thread, or failing that RPi.GPIO's
+        input_a._start_line_events([input_b])
+        self._line_events = input_a._line_events
+        input_a._add_listener(self._edge_a)
+        input_b._add_listener(self._edge_b)
+
+    def _edge(self, shift, timestamp, level):
+        state = (self.state & ~(1 << shift)) | (level << shift)
+        if state == self.state:
+            # Missed the edge before this one on the same input
+            self.errors += 1
+            return
+
+        step = TRANSITIONS[(self.state << 2) | state]
+        self.state = state
+
+        if step is None:
+            self.errors += 1
+            return
+
+        self.position += step
+        self.steps.append(timestamp, self.position)
+
+    def _edge_a(self, timestamp, level):
+        self._edge(1, timestamp, level)
+
+    def _edge_b(self, timestamp, level):
+        self._edge(0, timestamp, level)
+
+    def velocity(self, window=0.1):
+        """Returns the speed in counts per second, negative for backwards, over the last "window" seconds
+
+        @param window Measure over the steps from the last "window" seconds"""
+        timestamps, positions = self.steps.window()
+        count = len(timestamps)
+        first = bisect_left(timestamps, monotonic() - window, 0, count) if count else 0
+
+        if count - first < 2:
+            return 0.0
+
+        return (positions[count - 1] - positions[first]) / (timestamps[count - 1] - timestamps[first])
+
+    def reset(self):
+        """Sets the position and error count back to 0"""
+        self.position = 0
+        self.errors = 0
+        self.steps.clear()
+
+    def stop(self):
+        """Stops decoding"""
+        self.input_a._remove_listener(self._edge_a)
+        self.input_b._remove_listener(self._edge_b)
+        self._line_events = None
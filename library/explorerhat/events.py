@@ -0,0 +1,132 @@
+import threading
+import traceback
+from collections import deque
+
+try:
+    from time import monotonic
+except ImportError:
+    # Python 2 doesn't have a monotonic clock, make do with wall-clock time
+    from time import time as monotonic
+
+from .pins import StoppableThread
+
+
+class EdgeStats(object):
+    """Timing of the edges dispatched for one input
+
+    Latency is the time from sampling an edge's level until its
+    handlers were called, handler time is how long they took."""
+    def __init__(self):
+        self.edges = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.total_handler_time = 0.0
+        self.max_handler_time = 0.0
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+    def edge(self, latency, handler_time):
+        self.edges += 1
+        self.total_latency += latency
+        self.total_handler_time += handler_time
+        if latency > self.max_latency:
+            self.max_latency = latency
+        if handler_time > self.max_handler_time:
+            self.max_handler_time = handler_time
+
+    def as_dict(self):
+        return {
+            'edges': self.edges,
+            'mean_latency': self.total_latency / self.edges if self.edges else 0.0,
+            'max_latency': self.max_latency,
+            'mean_handler_time': self.total_handler_time / self.edges if self.edges else 0.0,
+            'max_handler_time': self.max_handler_time
+        }
+
+
+class EdgeDispatcher(StoppableThread):
+    def __init__(self, queue):
+        StoppableThread.__init__(self)
+        self.queue = queue
+
+    def run(self):
+        while True:
+            self.queue.ready.acquire()
+            edge = self.queue.edges.popleft()
+            if edge is None:
+                return
+            input, timestamp, level = edge
+            try:
+                input._dispatch(timestamp, level)
+            except Exception:
+                # Report it and carry on, or every edge after this one would be dropped
+                traceback.print_exc()
+
+
+class EdgeQueue(object):
+    """Bounded queue of edges, handled by a pool of dispatcher threads
+
+    Keeps the GPIO event thread free to catch the next edge however
+    slow the handlers are. Once "size" edges are waiting, new ones are
+    dropped and counted rather than blocking.
+
+    With more than one dispatcher, handlers for different inputs can run
+    at the same time, and edges can be handled in a different order to
+    how they came, use one to keep order. Each input still handles one
+    edge at a time.
+
+    @param size Most edges to hold waiting for a dispatcher
+    @param dispatchers Number of threads running handlers"""
+    def __init__(self, size=256, dispatchers=1):
+        if size < 1:
+            raise ValueError("Size must be at least 1")
+        if dispatchers < 1:
+            raise ValueError("Dispatchers must be at least 1")
+
+        self.size = size
+        # deque appends and pops are atomic, so the only lock is the count of waiting edges
+        self.edges = deque()
+        self.ready = threading.Semaphore(0)
+
+        self.queued = 0
+        self.dropped = 0
+        self.high_water = 0
+
+        self.dispatchers = [EdgeDispatcher(self) for dispatcher in range(dispatchers)]
+        for dispatcher in self.dispatchers:
+            dispatcher.start()
+
+    def put(self, input, timestamp, level):
+        """Queues an edge, returns False if the queue is full and it was dropped"""
+        pending = len(self.edges)
+
+        if pending >= self.size:
+            self.dropped += 1
+            return False
+
+        self.edges.append((input, timestamp, level))
+        self.ready.release()
+
+        self.queued += 1
+        if pending + 1 > self.high_water:
+            self.high_water = pending + 1
+        return True
+
+    def stats(self):
+        """Returns a dict of edges queued, dropped, waiting now and the most ever waiting"""
+        return {
+            'size': self.size,
+            'queued': self.queued,
+            'dropped': self.dropped,
+            'pending': len(self.edges),
+            'high_water': self.high_water
+        }
+
+    def stop(self):
+        """Stops the dispatchers once they've handled every edge already queued"""
+        for dispatcher in self.dispatchers:
+            self.edges.append(None)
+            self.ready.release()
+        for dispatcher in self.dispatchers:
+            dispatcher.join()
@@ -0,0 +1,82 @@
+from array import array
+from bisect import bisect_left, insort
+
+
+class ExponentialMovingAverage(object):
+    """Smooths readings by blending each one into a running average
+
+    @param alpha Weight given to each new reading, from 0 to 1. Smaller is smoother"""
+    def __init__(self, alpha=0.2):
+        if not 0 < alpha <= 1:
+            raise ValueError("Alpha must be greater than 0 and at most 1")
+
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+    def reset(self):
+        self.value = None
+
+
+class MovingAverage(object):
+    """Averages the last "size" readings
+
+    Keeps a running total, so each update costs the same however large size is."""
+    def __init__(self, size=8):
+        if size < 1:
+            raise ValueError("Size must be at least 1")
+
+        self.size = size
+        self.reset()
+
+    def update(self, value):
+        index = self.count % self.size
+
+        if self.count >= self.size:
+            self.total -= self.samples[index]
+
+        self.samples[index] = value
+        self.total += value
+        self.count += 1
+
+        return self.total / min(self.count, self.size)
+
+    def reset(self):
+        self.samples = array('d', [0.0]) * self.size
+        self.total = 0.0
+        self.count = 0
+
+
+class Median(object):
+    """Returns the median of the last "size" readings, good for knocking out spikes
+
+    Keeps the window sorted as readings come and go, rather than sorting it every update."""
+    def __init__(self, size=5):
+        if size < 1:
+            raise ValueError("Size must be at least 1")
+
+        self.size = size
+        self.reset()
+
+    def update(self, value):
+        index = self.count % self.size
+
+        if self.count >= self.size:
+            del self.sorted[bisect_left(self.sorted, self.samples[index])]
+
+        self.samples[index] = value
+        insort(self.sorted, value)
+        self.count += 1
+
+        return self.sorted[len(self.sorted) // 2]
+
+    def reset(self):
+        self.samples = array('d', [0.0]) * self.size
+        self.sorted = []
+        self.count = 0
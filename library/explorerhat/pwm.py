@@ -0,0 +1,253 @@
+"""PWM backends for Output and Motor
+
+Every backend hands out channels with the same methods as an
+RPi.GPIO PWM object: start(), stop(), ChangeDutyCycle() and
+ChangeFrequency(). Duty cycles are always 0-100.
+
+Backends also have read(pin), giving the level of a pin they drive,
+and cleanup(), called when Explorer HAT exits.
+
+Channels say how slow a blink they can time with "min_frequency",
+the lowest frequency they can do. Those without are assumed to
+manage down to explorerhat.BLINK_FREQUENCY, like RPi.GPIO."""
+
+import os
+
+
+class RPiGPIOBackend(object):
+    """RPi.GPIO software PWM, a thread per pin. Works on any pin"""
+    name = 'rpigpio'
+
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        self.GPIO = GPIO
+
+    def channel(self, pin, frequency):
+        self.GPIO.setup(pin, self.GPIO.OUT, initial=self.GPIO.LOW)
+        return self.GPIO.PWM(pin, frequency)
+
+    def read(self, pin):
+        return self.GPIO.input(pin)
+
+    def cleanup(self):
+        # GPIO.cleanup() takes care of everything
+        pass
+
+
+class PigpioChannel(object):
+    # Lowest frequency pigpiod can do at its default 5us sample rate
+    min_frequency = 10
+
+    def __init__(self, pi, pin, frequency):
+        self.pi = pi
+        self.pin = pin
+        self.frequency = frequency
+        self.duty_cycle = 0
+
+    def start(self, duty_cycle):
+        # pigpio picks the nearest frequency it can do at its sample rate
+        self.pi.set_PWM_frequency(self.pin, self.frequency)
+        self.ChangeDutyCycle(duty_cycle)
+
+    def stop(self):
+        self.pi.set_PWM_dutycycle(self.pin, 0)
+
+    def ChangeDutyCycle(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+        self.pi.set_PWM_dutycycle(self.pin, int(round(duty_cycle * PigpioBackend.RANGE / 100.0)))
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+        self.pi.set_PWM_frequency(self.pin, frequency)
+
+
+class PigpioBackend(object):
+    """DMA-timed PWM from the pigpio daemon, works on any pin
+
+    Needs the pigpio module, and pigpiod running. Timing is done by
+    the daemon, so there are no threads in Python and far less jitter."""
+    name = 'pigpio'
+    RANGE = 1000
+
+    def __init__(self, host='localhost', port=8888):
+        try:
+            import pigpio
+        except ImportError:
+            raise ImportError("The pigpio backend requires the pigpio module\nInstall with: sudo apt-get install python3-pigpio")
+
+        self.pigpio = pigpio
+        self.pi = pigpio.pi(host, port)
+
+        if not self.pi.connected:
+            raise RuntimeError("Unable to connect to pigpiod, start it with: sudo pigpiod")
+
+        self.channels = {}
+
+    def channel(self, pin, frequency):
+        self.pi.set_mode(pin, self.pigpio.OUTPUT)
+        self.pi.write(pin, 0)
+        self.pi.set_PWM_range(pin, self.RANGE)
+        self.channels[pin] = PigpioChannel(self.pi, pin, frequency)
+        return self.channels[pin]
+
+    def read(self, pin):
+        return self.pi.read(pin)
+
+    def cleanup(self):
+        # pigpiod keeps driving PWM after we disconnect, so turn everything off first
+        for pin in self.channels:
+            self.pi.set_PWM_dutycycle(pin, 0)
+            self.pi.set_mode(pin, self.pigpio.INPUT)
+        self.channels = {}
+        self.pi.stop()
+
+
+class SysfsChannel(object):
+    # The period is written in nanoseconds, which must fit in 32 bits
+    min_frequency = 1000000000.0 / 0xffffffff
+
+    def __init__(self, path, frequency):
+        self.path = path
+        self.frequency = frequency
+        self.duty_cycle = 0
+        self.period = 0
+        self.running = False
+
+    def _write(self, name, value):
+        with open(os.path.join(self.path, name), 'w') as f:
+            f.write(str(value))
+
+    def start(self, duty_cycle):
+        self.ChangeFrequency(self.frequency)
+        self.ChangeDutyCycle(duty_cycle)
+        self._write('enable', 1)
+        self.running = True
+
+    def stop(self):
+        self._write('enable', 0)
+        self.running = False
+
+    def ChangeDutyCycle(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+        self._write('duty_cycle', int(self.period * duty_cycle / 100.0))
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+        # The duty cycle can never be longer than the period, so shrink it first
+        self._write('duty_cycle', 0)
+        self.period = int(1000000000.0 / frequency)
+        self._write('period', self.period)
+        self._write('duty_cycle', int(self.period * self.duty_cycle / 100.0))
+
+
+class SysfsBackend(object):
+    """Hardware PWM through /sys/class/pwm
+
+    Only GPIO 12, 13, 18 and 19 can be hardware PWM, and the pins must be
+    given to the PWM peripheral with a dtoverlay, eg for Explorer HAT outputs
+    two and three: dtoverlay=pwm-2chan,pin=12,func=4,pin2=13,func=4
+
+    Any other pin falls back to RPi.GPIO software PWM.
+
+    @param pins Dict of BCM pin: PWM channel, matching your dtoverlay"""
+    name = 'sysfs'
+
+    def __init__(self, pins=None, chip='/sys/class/pwm/pwmchip0'):
+        if not os.path.exists(chip):
+            raise RuntimeError("No PWM chip at {}, check your dtoverlay".format(chip))
+
+        self.chip = chip
+        self.pins = pins if pins is not None else {12: 0, 13: 1}
+        self.fallback = RPiGPIOBackend()
+        self.channels = {}
+
+    def channel(self, pin, frequency):
+        if pin not in self.pins:
+            return self.fallback.channel(pin, frequency)
+
+        path = os.path.join(self.chip, 'pwm{}'.format(self.pins[pin]))
+
+        if not os.path.exists(path):
+            with open(os.path.join(self.chip, 'export'), 'w') as f:
+                f.write(str(self.pins[pin]))
+
+        self.channels[pin] = SysfsChannel(path, frequency)
+        return self.channels[pin]
+
+    def read(self, pin):
+        if pin not in self.channels:
+            return self.fallback.read(pin)
+
+        # The pin belongs to the PWM peripheral, so all we can say is whether it's driven at all
+        channel = self.channels[pin]
+        return 1 if channel.running and channel.duty_cycle > 0 else 0
+
+    def cleanup(self):
+        for pin in self.channels:
+            self.channels[pin].stop()
+
+
+class FakeChannel(object):
+    def __init__(self, pin, frequency):
+        self.pin = pin
+        self.frequency = frequency
+        self.duty_cycle = 0
+        self.running = False
+        self.writes = 0
+
+    def start(self, duty_cycle):
+        self.running = True
+        self.duty_cycle = duty_cycle
+        self.writes += 1
+
+    def stop(self):
+        self.running = False
+        self.writes += 1
+
+    def ChangeDutyCycle(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+        self.writes += 1
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+        self.writes += 1
+
+
+class FakeBackend(object):
+    """Keeps PWM state in memory, for testing without hardware
+
+    Every channel handed out is kept in "channels", keyed by pin."""
+    name = 'fake'
+
+    def __init__(self):
+        self.channels = {}
+
+    def channel(self, pin, frequency):
+        self.channels[pin] = FakeChannel(pin, frequency)
+        return self.channels[pin]
+
+    def read(self, pin):
+        channel = self.channels[pin]
+        return 1 if channel.running and channel.duty_cycle > 0 else 0
+
+    def cleanup(self):
+        pass
+
+
+backends = {
+    RPiGPIOBackend.name: RPiGPIOBackend,
+    PigpioBackend.name: PigpioBackend,
+    SysfsBackend.name: SysfsBackend,
+    FakeBackend.name: FakeBackend
+}
+
+
+def get_backend(backend):
+    """Returns a backend instance for a name, or the backend itself if it's already one"""
+    if not isinstance(backend, str):
+        return backend
+
+    try:
+        return backends[backend.lower()]()
+    except KeyError:
+        raise ValueError("PWM backend must be one of: {}".format(', '.join(sorted(backends))))